@@ -0,0 +1,90 @@
+# Headless batch runner: the life cycle of Risk and Reward for a whole book of households.
+#
+#   python -m batch_runner scenarios.csv results.parquet --paths 1000 --workers 4
+#
+# The input (CSV or Parquet) has one row per household. Missing columns take the defaults of the page
+# (see SCENARIO_DEFAULTS in utils.py), other columns are copied to the output untouched. Years are whole
+# numbers: a fractional years_work or years_retirement stops the run with a ValueError.
+# Scenarios are simulated in vectorized batches, the batches are spread over the CPU cores, and the
+# percentiles of the final wealth and the probability that the money lasts are written to Parquet.
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from utils import SCENARIO_DEFAULTS, simulate_life_cycle_batch
+from compute import LifeCycle, MarketModel, Fees, scenario_digest
+
+PERCENTILES = (5, 50, 95)
+
+def read_scenarios(path):
+    if path.endswith(".parquet"):
+        scenarios = pd.read_parquet(path)
+    else:
+        scenarios = pd.read_csv(path)
+    for column, default in SCENARIO_DEFAULTS.items():
+        if column not in scenarios:
+            scenarios[column] = default
+    return scenarios.reset_index(drop=True)
+
+# Same key as the pages' caches: a household draws its markets from the digest of its parameters,
+# so the results do not depend on the batch size, the number of workers or the order of the rows.
+def household_digest(job_savings, years_work, retirement_spending, years_retirement, investment_rate, investment_volatility, yearly_fees):
+    return scenario_digest(LifeCycle(job_savings, years_work, retirement_spending, years_retirement),
+                           MarketModel(investment_rate, investment_volatility),
+                           Fees(yearly_fees))
+
+# One batch, in a worker process
+def run_batch(batch, n_paths, seed):
+    digests = [household_digest(*values) for values in zip(*(batch[column] for column in SCENARIO_DEFAULTS))]
+    rngs = [np.random.default_rng([seed, digest]) for digest in digests]
+    result = simulate_life_cycle_batch(*(batch[column] for column in SCENARIO_DEFAULTS), n_paths=n_paths, rngs=rngs, percentiles=PERCENTILES)
+    columns = {"scenario": batch["scenario"], "success_probability": result["success_probability"]}
+    for i, q in enumerate(PERCENTILES):
+        columns[f"final_p{q}"] = result["percentiles"][:, i]
+    return pd.DataFrame(columns)
+
+# Split the scenarios in batches of about max_values simulated months each (the memory of one batch)
+def make_batches(scenarios, n_paths, max_values=4_000_000):
+    months = 12*(scenarios["years_work"].to_numpy() + scenarios["years_retirement"].to_numpy())
+    # similar horizons together, so that short scenarios are not padded to the longest one
+    order = np.argsort(months, kind="stable")
+    batch_size = max(1, int(max_values // (n_paths * max(months.max(), 1))))
+    for start in range(0, len(order), batch_size):
+        index = order[start:start+batch_size]
+        batch = {column: scenarios[column].to_numpy()[index] for column in SCENARIO_DEFAULTS}
+        batch["scenario"] = index
+        yield batch
+
+def run_scenarios(scenarios, n_paths=1000, workers=None, seed=0):
+    batches = list(make_batches(scenarios, n_paths))
+    if workers == 1:
+        results = [run_batch(batch, n_paths, seed) for batch in batches]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(run_batch, batches, [n_paths]*len(batches), [seed]*len(batches)))
+    results = pd.concat(results).set_index("scenario").sort_index()
+    return pd.concat([scenarios, results], axis=1)
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate the life cycle of many households at once.")
+    parser.add_argument("scenarios", help="CSV or Parquet file, one household per row")
+    parser.add_argument("output", help="Parquet file for the results")
+    parser.add_argument("--paths", type=int, default=1000, help="simulations per household (default: 1000)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes (default: all cores)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    scenarios = read_scenarios(args.scenarios)
+    start = time.perf_counter()
+    results = run_scenarios(scenarios, args.paths, args.workers, args.seed)
+    elapsed = time.perf_counter() - start
+    results.to_parquet(args.output, index=False)
+    print(f"{len(results)} scenarios in {elapsed:.1f}s: {len(results)/elapsed:.1f} scenarios/s "
+          f"({args.paths} simulations each, {args.workers} workers)")
+
+if __name__ == "__main__":
+    main()
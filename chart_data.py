@@ -0,0 +1,23 @@
+import functools
+
+import numpy as np
+
+# Chart data straight from the engine arrays: the time axes are built once per horizon and shared,
+# and the DataFrames given to st.line_chart wrap the arrays instead of copying them.
+
+# Time in years of n_points steps, starting from step `start`: [start, start+1, ...] / steps_per_year.
+# Cached and read-only, so every page and every rerun with the same horizon shares the same array.
+@functools.lru_cache(maxsize=256)
+def time_axis(n_points, steps_per_year=1, start=0):
+    axis = np.arange(start, start + n_points, dtype=float) / steps_per_year
+    axis.flags.writeable = False
+    return axis
+
+# DataFrame with one column per entry of `columns` (name -> 1-d array, or a scalar for a flat line).
+# Arrays are kept as they are (no consolidation copy), scalars become zero-stride views.
+# pandas is only imported here, the first time a page draws such a chart.
+def chart_frame(columns):
+    import pandas as pd
+    n_points = max(np.shape(value)[0] for value in columns.values() if np.ndim(value))
+    return pd.DataFrame({name: np.broadcast_to(value, n_points) if np.ndim(value) == 0 else np.asarray(value)
+                         for name, value in columns.items()}, copy=False)
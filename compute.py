@@ -0,0 +1,340 @@
+import hashlib
+from dataclasses import dataclass, fields
+
+import numpy as np
+
+from utils import (compounding_frequency_adjusted, generate_deltas_batch, generate_coarse_paths, compare_contribution_strategies,
+                   calculate_compound_interest, calculate_risk_metrics, percentile_confidence_interval, probability_standard_error,
+                   required_paths, z_score, simulate_fees, incremental_simulate_fees, invest_cashflows, generate_asset_deltas, glide_path_weights, blend_returns,
+                   simulate_withdrawals, withdrawal_statistics, simulate_taxes,
+                   simulate_rebalancing, simulate_scenario_set)
+
+# Scenario parameters and the pure computations of the pages, without any Streamlit.
+# The pages only turn widgets into parameters; st.cache_data, the background prefetch and the batch
+# runner all key their results on the same objects.
+
+# --- PARAMETERS ---
+
+# Frozen and slotted: cheap to create, to hash and to compare. Fields are converted to their declared type
+# on creation, so a slider int and a number_input float give equal objects and equal cache keys.
+# An int field refuses a fractional value instead of truncating it (12.5 years of work are not 12).
+class Parameters:
+    __slots__ = ()
+
+    def __post_init__(self):
+        for field in fields(self):
+            value = getattr(self, field.name)
+            converted = field.type(value)
+            if field.type is int and converted != value:
+                raise ValueError(f"{type(self).__name__}.{field.name} must be a whole number, got {value!r}")
+            object.__setattr__(self, field.name, converted)
+
+    # Canonical text of the parameters, the same in every process (hash() of strings is not)
+    def key(self):
+        return type(self).__name__ + "(" + ", ".join(f"{field.name}={getattr(self, field.name)!r}" for field in fields(self)) + ")"
+
+    # 64-bit digest of key(), e.g. to seed the random draws of a scenario
+    def digest(self):
+        return scenario_digest(self)
+
+# 64-bit digest of several parameter objects together, e.g. a whole scenario
+def scenario_digest(*parameters):
+    key = "; ".join(p.key() for p in parameters)
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+# Market of a single asset: yearly return in %, volatility in %/month as on the pages
+@dataclass(frozen=True, slots=True)
+class MarketModel(Parameters):
+    rate: float = 7.
+    volatility: float = 2.
+
+    @property
+    def monthly_rate(self):
+        return compounding_frequency_adjusted(self.rate, 12)
+
+# Savings per year while working, spending per year in retirement (real values)
+@dataclass(frozen=True, slots=True)
+class LifeCycle(Parameters):
+    job_savings: float = 1000.
+    years_work: int = 40
+    retirement_spending: float = 5000.
+    years_retirement: int = 30
+
+    @property
+    def years(self):
+        return self.years_work + self.years_retirement
+
+    def yearly_contributions(self):
+        return np.repeat([self.job_savings, -self.retirement_spending], [self.years_work, self.years_retirement])
+
+    def monthly_contributions(self):
+        return np.repeat([self.job_savings/12, -self.retirement_spending/12], [12*self.years_work, 12*self.years_retirement])
+
+# Costs of Fees keep you poor, all in %
+@dataclass(frozen=True, slots=True)
+class Fees(Parameters):
+    yearly_fees: float = 0.
+    transaction_fees: float = 0.
+    performance_fees: float = 0.
+    benchmark: float = 0.
+    wealth_tax: float = 0.
+    wealth_tax_threshold: float = np.inf
+
+# Taxes on the money taken out in retirement, all in %: capital gains tax on a taxable account, income tax
+# on the savings while working (a tax-deferred account saves from pre-tax income) and on its withdrawals
+@dataclass(frozen=True, slots=True)
+class Taxes(Parameters):
+    capital_gains_tax: float = 26.
+    work_income_tax: float = 30.
+    retirement_income_tax: float = 20.
+
+# Allocation over a life cycle: the share of stocks (%) in each year, the rest in bonds
+@dataclass(frozen=True, slots=True)
+class GlidePath(Parameters):
+    name: str = "Constant"
+    stock_shares: tuple = ()
+
+# Spending rule in retirement, see simulate_withdrawals. Floor, ceiling, guardrail and adjustment in %,
+# the defaults are the fixed spending of the pages
+@dataclass(frozen=True, slots=True)
+class WithdrawalPolicy(Parameters):
+    name: str = "Fixed spending"
+    follow_wealth: bool = False
+    floor: float = 0.
+    ceiling: float = np.inf
+    guardrail: float = np.inf
+    adjustment: float = 0.
+
+# When to bring a portfolio back to its target: every `months` months (0 = never) and/or when a weight drifts
+# more than `band` percentage points away (inf = never), see simulate_rebalancing
+@dataclass(frozen=True, slots=True)
+class RebalancingRule(Parameters):
+    name: str = "Buy and hold"
+    months: int = 0
+    band: float = np.inf
+
+# --- RESULTS ---
+
+# Monthly investing, lump sum and value averaging on the same markets (see compare_contribution_strategies).
+# bands: 5/50/95 percentiles of the monthly investing wealth, one column per month after the start
+@dataclass(frozen=True, slots=True, eq=False)
+class StrategyComparison:
+    n_paths: int
+    bands: np.ndarray
+    lump_median: np.ndarray
+    final: np.ndarray
+    gain: np.ndarray
+    win_rate: np.ndarray
+
+# Several glide paths on the same markets: 5/50/95 percentiles of the wealth, shape (n_glide_paths, 3, n_months),
+# final wealth, shape (n_glide_paths, n_paths), and the share of paths where the money lasts
+@dataclass(frozen=True, slots=True, eq=False)
+class GlidePathComparison:
+    n_paths: int
+    bands: np.ndarray
+    final: np.ndarray
+    success_probability: np.ndarray
+
+# Several withdrawal policies on the same markets: 5/50/95 percentiles of the yearly spending, shape
+# (n_policies, 3, years_retirement), and of the wealth, shape (n_policies, 3, years_retirement+1), with the
+# statistics of withdrawal_statistics (one value per policy)
+@dataclass(frozen=True, slots=True, eq=False)
+class WithdrawalComparison:
+    n_paths: int
+    spending_bands: np.ndarray
+    wealth_bands: np.ndarray
+    statistics: dict
+
+# The same life cycle in the accounts of TAX_ACCOUNTS: 5/50/95 percentiles of the yearly wealth, shape
+# (n_accounts, 3, years+1), with per-account medians of the final wealth, the taxes paid and the tax still due
+# on the final wealth, and the share of paths where the money lasts
+TAX_ACCOUNTS = ["No taxes", "Taxable", "Tax-deferred"]
+
+@dataclass(frozen=True, slots=True, eq=False)
+class TaxComparison:
+    n_paths: int
+    bands: np.ndarray
+    median_final: np.ndarray
+    median_taxes: np.ndarray
+    median_tax_due: np.ndarray
+    success_probability: np.ndarray
+
+# Rebalancing rules on the same markets, one value per rule: medians over the paths of the final value, the fees
+# paid, the yearly tracking error (%) against the target portfolio rebalanced every month for free and the average
+# drift from the target (percentage points); the worst 5% final value and the rebalances per year on average
+@dataclass(frozen=True, slots=True, eq=False)
+class RebalancingStudy:
+    n_paths: int
+    median_final: np.ndarray
+    worst_final: np.ndarray
+    median_fees: np.ndarray
+    rebalances_per_year: np.ndarray
+    tracking_error: np.ndarray
+    drift: np.ndarray
+
+# Scenarios pinned on a page, evaluated together on the same markets. Bands: 5/50/95 percentiles of the wealth,
+# shape (n_scenarios, 3, n_months+1). Per scenario: median and worst 5% final wealth, the share of paths where the
+# money lasts, and the median over the paths of the final wealth minus the first scenario's on the same market
+@dataclass(frozen=True, slots=True, eq=False)
+class ScenarioSet:
+    n_paths: int
+    bands: np.ndarray
+    median_final: np.ndarray
+    worst_final: np.ndarray
+    success_probability: np.ndarray
+    median_difference: np.ndarray
+
+# How many scenarios a page lets you pin next to the current one
+MAX_PINNED = 4
+
+# Most monthly life cycles simulated for the contribution strategies (close to 1 GB at the peak),
+# and for the comparisons that replay several life cycles at once on the same markets
+MAX_STRATEGY_PATHS = 10000
+MAX_COMPARED_PATHS = 2000
+
+# --- COMPUTATIONS ---
+
+# Yearly values of n_paths markets over years, starting from initial_amount
+def annual_paths(market, years, n_paths, initial_amount, seed=0):
+    return generate_coarse_paths(n_paths, years, market.volatility/100, market.monthly_rate, start_val=initial_amount,
+                                 rng=np.random.default_rng(seed))
+
+# Pilot run: how many annual paths make every loss and shortfall probability (within ± tolerance) and every
+# 5/50/95 percentile (within ± tolerance of its value) precise enough, at every horizon?
+def montecarlo_size(market, years, initial_amount, risk_free_rate, tolerance, n_pilot=1000, max_paths=20000, seed=1):
+    pilot = annual_paths(market, years, n_pilot, initial_amount, seed)[:, 1:]
+    risk = calculate_risk_metrics(pilot, initial_amount,
+                                  target=calculate_compound_interest(initial_amount, risk_free_rate, np.arange(1, years+1)))
+    probabilities = np.stack([risk["Loss probability"], risk["Shortfall probability"]])
+    estimate, lower, upper = percentile_confidence_interval(pilot, [5, 50, 95])
+    half_width = np.concatenate([z_score()*probability_standard_error(probabilities, n_pilot).ravel(), (upper - lower).ravel()/2])
+    tolerance = np.concatenate([np.full(probabilities.size, tolerance), tolerance*np.abs(estimate).ravel()])
+    return required_paths(half_width, tolerance, n_pilot, max_paths=max_paths)
+
+# The three ways of investing the savings of a life cycle, replayed on the same monthly markets.
+# A pilot run picks the number of paths: the win rates within ± tolerance and the final median within
+# ± tolerance of the 5-95% spread of final wealth (the tails of a whole life cycle are too wide to pin down).
+def contribution_strategies(life_cycle, market, tolerance, n_pilot=1000, max_paths=MAX_STRATEGY_PATHS, seed=0):
+    n_steps = 12*life_cycle.years + 1
+    # the last month's flow falls after the horizon
+    contributions = life_cycle.monthly_contributions()[:-1]
+    n_accumulation = min(12*life_cycle.years_work, n_steps - 2)
+    pilot_seed, seed = np.random.SeedSequence(seed).spawn(2)
+
+    pilot = generate_deltas_batch(n_pilot, n_steps, market.volatility/100, market.monthly_rate, rng=np.random.default_rng(pilot_seed))
+    strategies = compare_contribution_strategies(pilot[:, :-1], contributions, n_accumulation, market.monthly_rate)
+    estimate, lower, upper = percentile_confidence_interval(strategies["wealth"][0][:, -1], [5, 50, 95])
+    half_width = np.concatenate([[(upper[1] - lower[1])/2], z_score()*probability_standard_error(strategies["win_rate"][1:], n_pilot)])
+    spread = max(estimate[2] - estimate[0], 1)
+    n_paths = required_paths(half_width, tolerance*np.array([spread, 1, 1]), n_pilot, max_paths=max_paths)
+
+    deltas = generate_deltas_batch(n_paths, n_steps, market.volatility/100, market.monthly_rate, rng=np.random.default_rng(seed))
+    strategies = compare_contribution_strategies(deltas[:, :-1], contributions, n_accumulation, market.monthly_rate)
+    monthly_paths = strategies["wealth"][0]
+    return StrategyComparison(
+        n_paths=n_paths,
+        bands=np.percentile(monthly_paths, [5, 50, 95], axis=0),
+        lump_median=np.median(strategies["wealth"][1], axis=0),
+        final=monthly_paths[:, -1],
+        gain=strategies["gain"],
+        win_rate=strategies["win_rate"],
+    )
+
+# simulate_fees with the costs of a Fees object
+def apply_fees(contributions, returns, fees, start_val=0.):
+    return simulate_fees(contributions, returns, fees.yearly_fees, fees.transaction_fees, fees.performance_fees, fees.benchmark,
+                         fees.wealth_tax, fees.wealth_tax_threshold, start_val)
+
+# apply_fees that only recomputes the steps after the first edited one (see incremental_simulate_fees)
+def apply_fees_incremental(cache, contributions, returns, fees):
+    return incremental_simulate_fees(cache, contributions, returns, fees.yearly_fees, fees.transaction_fees, fees.performance_fees,
+                                     fees.benchmark, fees.wealth_tax, fees.wealth_tax_threshold)
+
+# The life cycle of contribution_strategies invested along each glide path, all on the same stock and bond markets:
+# the assets are drawn once and every schedule only reweights them, so n glide paths cost about one single-asset run
+def glide_path_comparison(life_cycle, stocks, bonds, glide_paths, n_paths, correlation=0., seed=0):
+    n_steps = 12*life_cycle.years + 1
+    contributions = life_cycle.monthly_contributions()[:-1]
+    deltas = generate_asset_deltas(n_paths, n_steps, [stocks.volatility/100, bonds.volatility/100],
+                                   [stocks.monthly_rate, bonds.monthly_rate], correlation, rng=np.random.default_rng(seed))
+    weights = glide_path_weights([glide_path.stock_shares for glide_path in glide_paths])
+    wealth = invest_cashflows(1 + blend_returns(deltas[:, :-1], weights[:, :n_steps-2]), contributions)
+    return GlidePathComparison(
+        n_paths=n_paths,
+        bands=np.percentile(wealth, [5, 50, 95], axis=1).swapaxes(0, 1),
+        final=wealth[..., -1],
+        success_probability=(wealth.min(axis=-1) >= 0).mean(axis=-1),
+    )
+
+# The yearly life cycle with every withdrawal policy in retirement, all on the same markets:
+# the savings are invested until retirement, then the policies decide each year how much is taken out
+def withdrawal_comparison(life_cycle, market, policies, n_paths, seed=0):
+    paths = annual_paths(market, life_cycle.years, n_paths, 1., seed)
+    growth = paths[:, 1:] / paths[:, :-1]
+    saved = invest_cashflows(growth[:, :life_cycle.years_work], life_cycle.job_savings)[:, -1]
+    rules = {field.name: [getattr(policy, field.name) for policy in policies] for field in fields(WithdrawalPolicy) if field.name != "name"}
+    result = simulate_withdrawals(saved, growth[:, life_cycle.years_work:], life_cycle.retirement_spending, **rules)
+    return WithdrawalComparison(
+        n_paths=n_paths,
+        spending_bands=np.percentile(result["spending"], [5, 50, 95], axis=1).swapaxes(0, 1),
+        wealth_bands=np.percentile(result["wealth"], [5, 50, 95], axis=1).swapaxes(0, 1),
+        statistics=withdrawal_statistics(result),
+    )
+
+# The yearly life cycle after taxes, on the same markets for every account of TAX_ACCOUNTS. Savings are the
+# after-tax money the household puts aside: a tax-deferred account receives it grossed up by the work income tax.
+# Yearly fees in % are taken from the growth. Memory is about (accounts + 1) x n_paths x years floats.
+def after_tax_comparison(life_cycle, market, taxes, yearly_fees=0., n_paths=10_000, seed=0):
+    paths = annual_paths(market, life_cycle.years, n_paths, 1., seed)
+    growth = paths[:, 1:] / paths[:, :-1] * (1 - yearly_fees/100)
+    del paths
+    result = simulate_taxes(life_cycle.yearly_contributions(), growth,
+                            tax_rate=[0., taxes.capital_gains_tax, taxes.retirement_income_tax],
+                            gains_only=[True, True, False],
+                            contribution_scale=[1., 1., 1/(1 - taxes.work_income_tax/100)])
+    return TaxComparison(
+        n_paths=n_paths,
+        bands=np.percentile(result["wealth"], [5, 50, 95], axis=1).swapaxes(0, 1),
+        median_final=np.median(result["final"], axis=-1),
+        median_taxes=np.median(result["taxes"], axis=-1),
+        median_tax_due=np.median(result["tax_due"], axis=-1),
+        success_probability=1 - result["ruined"].mean(axis=-1),
+    )
+
+# A stock/bond portfolio held for `years` under every rebalancing rule at once, paying fee_rate % of the money
+# moved plus fee_fixed per trade. The markets are drawn once, monthly.
+def rebalancing_study(stocks, bonds, stock_share, rules, years, portfolio, fee_rate, fee_fixed, n_paths=2000, correlation=0., seed=0):
+    deltas = generate_asset_deltas(n_paths, 12*years + 1, [stocks.volatility/100, bonds.volatility/100],
+                                   [stocks.monthly_rate, bonds.monthly_rate], correlation, rng=np.random.default_rng(seed))
+    target = np.array([stock_share/100, 1 - stock_share/100])
+    result = simulate_rebalancing(deltas, target, period=[rule.months for rule in rules], band=[rule.band for rule in rules],
+                                  fee_rate=fee_rate, fee_fixed=fee_fixed, start_val=portfolio)
+    value = result["value"]
+    returns = value[..., 1:] / value[..., :-1] - 1
+    tracking = 100*np.sqrt(12)*(returns - deltas @ target).std(axis=-1)
+    return RebalancingStudy(
+        n_paths=n_paths,
+        median_final=np.median(value[..., -1], axis=-1),
+        worst_final=np.percentile(value[..., -1], 5, axis=-1),
+        median_fees=np.median(result["fees"], axis=-1),
+        rebalances_per_year=result["rebalances"].mean(axis=-1) / years,
+        tracking_error=np.median(tracking, axis=-1),
+        drift=np.median(result["drift"], axis=-1),
+    )
+
+# Several (life cycle, market, fees) scenarios in one vectorized pass on shared draws, the first one being the reference
+def scenario_set_comparison(scenarios, n_paths=1000, seed=0):
+    life_cycles, markets, fees = zip(*scenarios)
+    wealth = simulate_scenario_set([life_cycle.job_savings for life_cycle in life_cycles], [life_cycle.years_work for life_cycle in life_cycles],
+                                   [life_cycle.retirement_spending for life_cycle in life_cycles], [life_cycle.years_retirement for life_cycle in life_cycles],
+                                   [market.rate for market in markets], [market.volatility for market in markets],
+                                   [fee.yearly_fees for fee in fees], n_paths=n_paths, rng=np.random.default_rng(seed))
+    final = wealth[..., -1]
+    return ScenarioSet(
+        n_paths=n_paths,
+        bands=np.percentile(wealth, [5, 50, 95], axis=1).swapaxes(0, 1),
+        median_final=np.median(final, axis=-1),
+        worst_final=np.percentile(final, 5, axis=-1),
+        success_probability=(wealth.min(axis=-1) >= 0).mean(axis=-1),
+        median_difference=np.median(final - final[0], axis=-1),
+    )
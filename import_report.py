@@ -0,0 +1,69 @@
+# Import-time report: how long each page takes to import its dependencies on top of streamlit,
+# i.e. what a fresh worker pays before the first render of that page.
+#
+#   python -m import_report --top 5 --output benchmarks/import_times.txt
+#
+# Every page's top-level imports run in a fresh interpreter with `python -X importtime`, after
+# `import streamlit` (already loaded by the server). Imports inside functions or branches are lazy and
+# not counted: that is the point. Times are cumulative per top-level module, in milliseconds.
+import argparse
+import ast
+import os
+import platform
+import subprocess
+import sys
+
+from load_test import APP, registered_pages
+
+ROOT = os.path.dirname(APP)
+
+# Source of the top-level import statements of a script
+def top_level_imports(path):
+    with open(path) as f:
+        source = f.read()
+    return "\n".join(ast.get_source_segment(source, node) for node in ast.parse(source).body
+                     if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+# Parse the stderr of -X importtime: the top-level modules imported after streamlit, with their cumulative time in ms.
+# Lines come children first, nested modules are indented by two spaces per level.
+def parse_importtime(stderr, after="streamlit"):
+    modules = []
+    started = False
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        name = name[1:]
+        if name.startswith(" "):
+            continue
+        if started:
+            modules.append((name, int(cumulative)/1000))
+        started = started or name == after
+    return modules
+
+def measure(path):
+    code = "import streamlit\n" + top_level_imports(path)
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, capture_output=True, text=True)
+    return parse_importtime(result.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time of every page on top of streamlit (python -X importtime).")
+    parser.add_argument("--top", type=int, default=5, help="slowest modules listed per page (default: 5)")
+    parser.add_argument("--output", help="also write the report to this file")
+    args = parser.parse_args()
+
+    # times depend on the machine: say which one they come from
+    lines = [f"# Python {platform.python_version()} on {platform.system()} {platform.machine()}",
+             f"{'page':<40}{'import (ms)':>12}  slowest modules"]
+    for page in registered_pages():
+        modules = measure(os.path.join(ROOT, page))
+        slowest = sorted(modules, key=lambda m: -m[1])[:args.top]
+        lines.append(f"{page:<40}{sum(t for _, t in modules):>12.0f}  " + ", ".join(f"{name} {t:.0f}" for name, t in slowest))
+    report = "\n".join(lines)
+    print(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+
+if __name__ == "__main__":
+    main()
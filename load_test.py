@@ -0,0 +1,110 @@
+# Load test: many users clicking around the app at the same time, in one process like the server.
+#
+#   python -m load_test --sessions 8 --duration 60
+#
+# Every session is a headless AppTest of streamlit_app.py that keeps switching between the registered
+# pages and moving their widgets (sliders are scrubbed a few steps at a time, checkboxes toggled,
+# forms submitted). The caches are shared by all sessions, as on the server.
+# Reports the rerun latency (p50/p95/p99) per page, the throughput and the memory (RSS) over time.
+import argparse
+import os
+import random
+import re
+import threading
+import time
+
+import numpy as np
+
+from streamlit.testing.v1 import AppTest
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "streamlit_app.py")
+
+def registered_pages(app=APP):
+    with open(app) as f:
+        return re.findall(r'^\w+ = st\.Page\("([^"]+)"', f.read(), flags=re.MULTILINE)
+
+def current_rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        # no /proc (macOS, Windows): peak memory only
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+# One realistic widget change on the current page, or None if the page has nothing to touch
+def random_interaction(at, rng):
+    widgets = [w for w in at.slider if not isinstance(w.value, tuple)]
+    widgets += list(at.select_slider) + list(at.checkbox) + [b for b in at.button if b.label == "Run Simulation"]
+    if not widgets:
+        return None
+    widget = rng.choice(widgets)
+    if widget.type == "slider":
+        step = widget.step or 1
+        value = widget.value + rng.choice([-3, -2, -1, 1, 2, 3]) * step
+        value = min(max(value, widget.min), widget.max)
+        return widget.set_value(type(widget.value)(value))
+    if widget.type == "select_slider":
+        return widget.set_value(rng.choice(widget.options))
+    if widget.type == "checkbox":
+        return widget.set_value(not widget.value)
+    return widget.click()
+
+def run_session(session, pages, deadline, page_switch, timeout, records, seed):
+    rng = random.Random(seed + session)
+    at = AppTest.from_file(APP, default_timeout=timeout)
+    # the app opens on the first registered page, the homepage
+    page = pages[0]
+    action = at
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            action.run()
+            error = bool(at.exception)
+        except Exception:
+            error = True
+        records.append((page, time.perf_counter() - start, error))
+
+        action = random_interaction(at, rng) if rng.random() > page_switch else None
+        if action is None:
+            page = rng.choice(pages)
+            action = at.switch_page(page)
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive concurrent headless sessions of the app and measure rerun latency.")
+    parser.add_argument("--sessions", type=int, default=4, help="concurrent sessions (default: 4)")
+    parser.add_argument("--duration", type=float, default=60, help="seconds of load (default: 60)")
+    parser.add_argument("--page-switch", type=float, default=0.2, help="probability to change page instead of moving a widget")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds before a single rerun is considered stuck")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    pages = registered_pages()
+    records = []
+    memory = []
+    start = time.perf_counter()
+    deadline = start + args.duration
+    threads = [threading.Thread(target=run_session, args=(session, pages, deadline, args.page_switch, args.timeout, records, args.seed), daemon=True)
+               for session in range(args.sessions)]
+    for thread in threads:
+        thread.start()
+    while any(thread.is_alive() for thread in threads):
+        memory.append((time.perf_counter() - start, current_rss_mb()))
+        time.sleep(1)
+    elapsed = time.perf_counter() - start
+
+    print(f"{args.sessions} sessions, {len(records)} reruns in {elapsed:.0f}s: {len(records)/elapsed:.2f} reruns/s")
+    print(f"{'page':<40}{'reruns':>8}{'errors':>8}{'p50 (s)':>10}{'p95 (s)':>10}{'p99 (s)':>10}")
+    for page in sorted(set(r[0] for r in records)) + ["all"]:
+        rows = [r for r in records if page in ("all", r[0])]
+        latency = np.array([r[1] for r in rows])
+        p50, p95, p99 = np.percentile(latency, [50, 95, 99])
+        print(f"{page:<40}{len(rows):>8}{sum(r[2] for r in rows):>8}{p50:>10.2f}{p95:>10.2f}{p99:>10.2f}")
+
+    print("\nRSS over time (MB)")
+    for second, rss in memory[::max(1, len(memory)//20)]:
+        print(f"{second:>6.0f}s {rss:>8.0f}")
+    print(f"peak {max(rss for _, rss in memory):.0f} MB")
+
+if __name__ == "__main__":
+    main()
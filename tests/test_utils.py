@@ -0,0 +1,18 @@
+import numpy as np
+
+from utils import generate_inflation_paths
+
+
+# No persistence: each year's inflation is the mean plus an independent shock, never NaN
+def test_inflation_paths_without_persistence():
+    paths = generate_inflation_paths(1000, 50, 7., 15., 2., 1., persistence=0., rng=np.random.default_rng(0))
+    for values in paths.values():
+        assert np.isfinite(values).all()
+    assert abs(paths["inflation"].mean() - 2.) < 0.1
+    assert abs(paths["inflation"].std() - 1.) < 0.1
+
+# A small persistence over many monthly steps used to underflow persistence**t
+def test_inflation_paths_small_persistence_monthly():
+    paths = generate_inflation_paths(100, 12*50, 7., 15., 2., 1., persistence=0.01, steps_per_year=12, rng=np.random.default_rng(0))
+    for values in paths.values():
+        assert np.isfinite(values).all()
@@ -1,7 +1,10 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 
-from utils import calculate_compound_interest, calculate_breakeven_year, calculate_constant_investment
+from utils import calculate_compound_interest, calculate_breakeven_year, calculate_constant_investment, incremental_life_cycle_wealth, crash_timing_sweep, generate_inflation_paths
+from chart_data import time_axis, chart_frame
+from compute import LifeCycle
 
 # --- 1. SETUP THE PAGE ---
 # This configures the browser tab title and layout if standalone
@@ -42,7 +45,7 @@ with col3:
     # Slider for the number of years
     chicken_amount = st.number_input("Final Amount (Chicken)", value=10.0, step=1.0)
 
-year_range = list(range(101))
+year_range = time_axis(101)
 invested_values = calculate_compound_interest(initial_amount, investment_rate, year_range)
 
 breakeven_year = calculate_breakeven_year(chicken_amount, initial_amount, investment_rate)
@@ -52,7 +55,7 @@ if breakeven_year > 100:
 else:
     st.success(f"🎉 Your egg will grow into a chicken in **{breakeven_year:.1f} years**.")
     
-    Egg_dataframe = pd.DataFrame({
+    Egg_dataframe = chart_frame({
     "Year": year_range,
     "Investment egg": invested_values,
     "Original chicken": chicken_amount 
@@ -98,14 +101,14 @@ with col3:
 # We use standard Python/NumPy/Pandas logic here.
 # Logic: Adjusted Value = Amount / (1 + rate/100)^year
 
-# Create a list of years from 0 to N
-year_range = list(range(years + 1))
+# Years from 0 to N (shared between reruns with the same horizon)
+year_range = time_axis(years + 1)
 
 # Calculate the value for each year
 adjusted_values = initial_amount / calculate_compound_interest(1, inflation_rate, year_range)
 
-# Create a Pandas DataFrame (The standard format for data plotting)
-df = pd.DataFrame({
+# Wrap the arrays in a DataFrame (The standard format for data plotting), without copying them
+df = chart_frame({
     "Year": year_range,
     "Purchasing Power": adjusted_values
 })
@@ -125,6 +128,59 @@ st.metric(
 st.subheader("Purchasing Power Over Time")
 st.line_chart(df, x="Year", y="Purchasing Power", x_label="Year", y_label="Purchasing Power")
 
+st.markdown("""**🎲 Inflation is not a fixed number.** It wanders around: a few years of high inflation tend to be followed by more high inflation, and markets react to it. Tick the box to simulate 10,000 possible futures where inflation drifts around your value, next to the same money invested in the market.
+""")
+
+uncertain_inflation = st.checkbox("Make inflation uncertain")
+
+@st.cache_data
+def run_inflation(n_paths, years, investment_rate, yearly_volatility, inflation_rate, inflation_volatility, persistence, correlation, seed=0):
+    return generate_inflation_paths(n_paths, years, investment_rate, yearly_volatility, inflation_rate, inflation_volatility,
+                                    persistence, correlation, rng=np.random.default_rng(seed))
+
+if uncertain_inflation:
+    with st.expander("⚙️ Settings"):
+        opt_col1, opt_col2 = st.columns(2)
+        with opt_col1:
+            inflation_volatility = st.number_input("Inflation shocks (%/year)", value=1.0, step=0.1)
+        with opt_col2:
+            persistence = st.slider("Inflation persistence", min_value=0.0, max_value=0.95, value=0.7)
+        opt_col1, opt_col2, opt_col3 = st.columns(3)
+        with opt_col1:
+            market_rate = st.number_input("Investment Return (%)", value=7.0, step=0.1)
+        with opt_col2:
+            market_volatility = st.number_input("Investment Volatility (%/year)", value=15.0, step=0.5)
+        with opt_col3:
+            correlation = st.slider("Correlation with inflation", min_value=-0.9, max_value=0.9, value=-0.2)
+
+    inflation_paths = run_inflation(10000, years, market_rate, market_volatility, inflation_rate, inflation_volatility, persistence, correlation)
+
+    # purchasing power of cash and of the same amount invested, with year 0 in front
+    cash_value = np.ones((10000, years+1))
+    cash_value[:, 1:] = 1 / inflation_paths["price_level"]
+    invested_value = np.ones((10000, years+1))
+    invested_value[:, 1:] = np.cumprod(1 + inflation_paths["real"]/100, axis=1)
+    cash_bands = initial_amount * np.percentile(cash_value, [5, 50, 95], axis=0)
+    invested_median = initial_amount * np.median(invested_value, axis=0)
+
+    st.metric(
+        label=f"Value in {years} years (median, 90% of scenarios between {cash_bands[0, -1]:,.0f} and {cash_bands[2, -1]:,.0f})",
+        value=f"{cash_bands[1, -1]:,.2f}",
+        delta=f"{cash_bands[1, -1] - initial_amount:,.2f}",
+        delta_color="normal"
+    )
+
+    uncertain_df = chart_frame({
+        "Year": year_range,
+        "Cash (worst 5%)": cash_bands[0],
+        "Cash (median)": cash_bands[1],
+        "Cash (best 5%)": cash_bands[2],
+        "Invested (median)": invested_median,
+    })
+    st.line_chart(uncertain_df, x="Year", y=["Cash (worst 5%)", "Cash (median)", "Cash (best 5%)", "Invested (median)"], x_label="Year", y_label="Purchasing Power", color=["#FFA07A", "#FF4B4B", "#FFA07A", "#32CD32"])
+
+    st.write(f"Invested in the market, {initial_amount:,} keeps its purchasing power in {100*np.mean(invested_value[:, -1] >= 1):.0f}% of scenarios after {years} years. Cash never does, unless inflation turns negative.")
+
 st.markdown(""" ### Takeaway message:
             
 Keeping your money tucked away is also risky. Inflation will silently erode the purchasing value of your money over time. One of the few guarantees of the financial world is that cash will buy you less over time. Investments and inflation are in a tug-of-war. To preserve and grow your wealth, your investments must outpace inflation. In the following examples, we'll talk only about the actual purchasing power of money, adjusting for inflation. This is called the *"real value"* or *"purchasing power parity"* of money.
@@ -158,13 +214,13 @@ with col3:
 with col4:
     years_delay = st.number_input("Years delay", value=10, step=1)
 
-year_range = list(range(41))
+year_range = time_axis(41)
 
 invested_job1 = calculate_constant_investment(job1_savings, investment_rate, 40)
 invested_job2 = [0]*years_delay
 invested_job2 = invested_job2 + calculate_constant_investment(job2_savings, investment_rate, 40-years_delay)
 
-jobs_comparison = pd.DataFrame({
+jobs_comparison = chart_frame({
     "Year": year_range,
     "Investment in Job 1": invested_job1,
     "Investment in Job 2": invested_job2
@@ -208,7 +264,8 @@ with col1:
 with col2:
     years_retirement = st.slider("Retirement (Years)", min_value=0, max_value=70, value=20)
 
-years = years_work+years_retirement
+life_cycle = LifeCycle(job_savings, years_work, retirement_spending, years_retirement)
+years = life_cycle.years
 
 st.markdown(""" **👇 Interactive Scenario:**  
 Real life isn't linear. What if the market crashes right when you retire? What if you get a promotion or win the lottery?  
@@ -218,7 +275,7 @@ Real life isn't linear. What if the market crashes right when you retire? What i
 default_data = pd.DataFrame({
     "Year": range(1, years + 1),
     "Investment Rate (%)": [investment_rate] * years, # [3.0, 3.0, 3.0, 3.0, 3.0]
-    "Contribution": [job_savings] * years_work + [-retirement_spending] * years_retirement
+    "Contribution": life_cycle.yearly_contributions()
 })
 
 # if st.checkbox("Edit yearly contributions"):
@@ -230,7 +287,8 @@ default_data = st.data_editor(
     column_config={
         "Investment Rate (%)": st.column_config.NumberColumn(
             "Investment Rate (%)",
-            format="%.1f%%"
+            format="%.1f%%",
+            min_value=-99.9 # nothing is left to compound after a 100% loss
         ),
         "Contribution ($)": st.column_config.NumberColumn(
             "Contribution",
@@ -241,9 +299,12 @@ default_data = st.data_editor(
     num_rows="fixed" # Prevents user from adding/deleting rows (optional)
 )
 
-invested = [0]
-for i in range(1, years):
-    invested.append( (invested[-1]+default_data["Contribution"][i-1]) * (1 + default_data["Investment Rate (%)"][i-1]/100))
+# editing one row only recomputes the years after it, the earlier ones are kept in the session
+invested = incremental_life_cycle_wealth(
+    st.session_state.setdefault("egg_life_cycle", {}),
+    default_data["Contribution"].to_numpy(),
+    1 + default_data["Investment Rate (%)"].to_numpy()/100
+)
 
 if min(invested) < 0:
     st.error("⚠️ Warning: You run out of invested money during retirement!")
@@ -256,11 +317,61 @@ if min(invested) < 0:
 else:
     st.success("🎉 Success: Your investments last through retirement!")
     
-# add column to dataframe
-default_data["Investment Value"] = invested
+# limit the chart to years
+life_cycle_dataframe = chart_frame({
+    "Year": time_axis(years, start=1),
+    "Investment Value": invested[:years],
+})
+st.line_chart(life_cycle_dataframe, x="Year", y="Investment Value", x_label="Years of investing", y_label="Investment Value Over Life")
+
+st.markdown(""" **💥 When does a crash hurt most?**  
+Instead of editing the table year by year, let's crash the market in *every* possible year, one at a time, and see what is left at the end of your life.
+""")
 
-st.line_chart(default_data[:years], x="Year", y="Investment Value", x_label="Years of investing", y_label="Investment Value Over Life")
-# limit data_frame to years
+col1, col2 = st.columns(2)
+with col1:
+    crash = st.slider("Crash (% lost in one year)", min_value=0, max_value=80, value=30)
+with col2:
+    show_heatmap = st.checkbox("Compare different retirement spending")
+
+table_contributions = default_data["Contribution"].to_numpy(dtype=float)[:-1]
+table_growth = 1 + default_data["Investment Rate (%)"].to_numpy(dtype=float)[:-1]/100
+crash_years = time_axis(len(table_growth), start=1)
+
+crash_result = crash_timing_sweep(table_contributions, table_growth, crash)
+
+crash_dataframe = chart_frame({
+    "Crash year": crash_years,
+    "Final wealth": crash_result["final"],
+})
+st.line_chart(crash_dataframe, x="Crash year", y="Final wealth", x_label="Year of the crash", y_label="Wealth at the end of life", color="#FF4B4B")
+
+if crash_result["ruined"].any():
+    st.warning(f"⚠️ A {crash}% crash makes you run out of money if it happens between year {crash_years[crash_result['ruined']].min():.0f} and year {crash_years[crash_result['ruined']].max():.0f}.")
+else:
+    st.success(f"🎉 You survive a {crash}% crash whenever it happens.")
+
+if show_heatmap:
+    # the same table with the withdrawals scaled from 50% to 150%
+    spending_factors = np.linspace(0.5, 1.5, 21)
+    scaled_contributions = np.where(table_contributions < 0, table_contributions * spending_factors[:, None], table_contributions)
+    sweep = crash_timing_sweep(scaled_contributions, table_growth, crash)
+
+    # plotly express is slow to import: only when the heatmap is asked for
+    import plotly.express as px
+    fig = px.imshow(
+        sweep["final"],
+        x=crash_years,
+        y=[f"{100*f:.0f}%" for f in spending_factors],
+        origin="lower",
+        aspect="auto",
+        color_continuous_scale="RdYlGn",
+        color_continuous_midpoint=0,
+        labels={'x': 'Year of the crash', 'y': 'Retirement spending', 'color': 'Final wealth'},
+        title="Wealth at the end of life, by crash year and spending",
+        template="simple_white",
+    )
+    st.plotly_chart(fig, use_container_width=True)
 
 st.markdown(""" ### 📝 Final Thoughts
 
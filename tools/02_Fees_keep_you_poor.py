@@ -1,7 +1,11 @@
 import streamlit as st
 import pandas as pd
 
-from utils import calculate_compound_interest
+import numpy as np
+
+from utils import calculate_compound_interest, incremental_life_cycle_wealth, generate_deltas_batch, FEE_COMPONENTS
+from compute import LifeCycle, Fees, Taxes, MarketModel, RebalancingRule, TAX_ACCOUNTS, MAX_PINNED, MAX_COMPARED_PATHS, apply_fees, apply_fees_incremental, after_tax_comparison, rebalancing_study, scenario_set_comparison
+from chart_data import time_axis, chart_frame
 
 # uncomment if standalone
 # st.set_page_config(page_title="Fees keep you poor", layout="centered")
@@ -42,11 +46,11 @@ with col4:
     # Input for fees rate (default 1%)
     fees_rate = st.number_input("Fees (%)", value=2.0, step=0.1)
 
-year_range = list(range(years+1))
+year_range = time_axis(years+1)
 invested_values = calculate_compound_interest(initial_amount, investment_rate, year_range)
 invested_fees_values = calculate_compound_interest(initial_amount, investment_rate - fees_rate, year_range)
 
-Fees_dataframe = pd.DataFrame({
+Fees_dataframe = chart_frame({
     "Year": year_range,
     "Investment": invested_values,
     "Investment with fees": invested_fees_values 
@@ -89,7 +93,6 @@ with col5:
     # Input for inflation rate (default 2%)
     trans_fees_currency = st.number_input("Fees (currency)", value=10.0, step=0.1)
 
-year_range = list(range(years+1))
 invested_transfees_values = calculate_compound_interest(initial_amount*(1-trans_fees_rate/100)-trans_fees_currency, investment_rate, year_range)
 
 fees_charged = initial_amount*trans_fees_rate/100+trans_fees_currency
@@ -105,6 +108,82 @@ st.markdown("""### Takeaway message:
             
 Transaction, currency conversion and all these other fees can be just a few euros/dollars/pounds, but over time the loss of not having invested those few bucks will be much larger. You did not just spend 10$, you killed the 100$ they would have become. The *time value* of a few bucks is significant! Be extra careful if you trade frequently.""")
 
+st.markdown("""**⚖️ How often should you rebalance?**  
+A portfolio of stocks and bonds does not stay at its mix: after a few good years it is mostly stocks, and riskier than you planned. Bringing it back to the target (*rebalancing*) means selling some of one and buying the other, and every trade pays the fees above. Rebalance too often and the fees eat your returns, too rarely and your risk drifts away from what you chose.
+
+Below, the same volatile markets are replayed with several rules, every trade paying the transaction fees of section 1: a fixed calendar, or only when the mix drifts more than a few percentage points away from the target. Set your portfolio and press the button.
+""")
+
+with st.form("Rebalancing"):
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        portfolio = st.number_input("Portfolio (currency)", value=100000.0, step=10000.0)
+    with col2:
+        stock_share = st.slider("Stocks (%)", min_value=0, max_value=100, value=60, step=5)
+    with col3:
+        rebalancing_years = st.slider("Horizon (Years)", min_value=1, max_value=75, value=30)
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        stock_rate = st.number_input("Stock Return (%)", value=7.0, step=0.1)
+    with col2:
+        stock_volatility = st.number_input("Stock Volatility (%/month)", value=4.0, step=0.5)
+    with col3:
+        correlation = st.number_input("Stock-bond correlation", min_value=-0.9, max_value=0.9, value=0.0, step=0.1)
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        bond_rate = st.number_input("Bond Return (%)", value=2.0, step=0.1)
+    with col2:
+        bond_volatility = st.number_input("Bond Volatility (%/month)", value=0.5, step=0.1)
+
+    # a couple of seconds per run: only once asked for, then cached for each set of inputs
+    if st.form_submit_button("Compare rebalancing rules"):
+        st.session_state.rebalancing_requested = True
+
+rules = (
+    RebalancingRule("Buy and hold"),
+    RebalancingRule("Monthly", months=1),
+    RebalancingRule("Quarterly", months=3),
+    RebalancingRule("Yearly", months=12),
+    RebalancingRule("Every 3 years", months=36),
+    RebalancingRule("5% band", band=5),
+    RebalancingRule("10% band", band=10),
+)
+
+# every rule in one run on the same 2,000 markets
+@st.cache_data(max_entries=16)
+def run_rebalancing(stocks, bonds, stock_share, rules, years, portfolio, fee_rate, fee_fixed, correlation):
+    return rebalancing_study(stocks, bonds, stock_share, rules, years, portfolio, fee_rate, fee_fixed, correlation=correlation)
+
+if st.session_state.get("rebalancing_requested"):
+    study = run_rebalancing(MarketModel(stock_rate, stock_volatility), MarketModel(bond_rate, bond_volatility), stock_share, rules,
+                            rebalancing_years, portfolio, trans_fees_rate, trans_fees_currency, correlation)
+
+    rebalancing_table = pd.DataFrame({
+        "Rule": [rule.name for rule in rules],
+        "Rebalances per year": study.rebalances_per_year,
+        "Median fees paid": study.median_fees,
+        "Median drift from target (%)": study.drift,
+        "Tracking error (%/year)": study.tracking_error,
+        "Median final value": study.median_final,
+        "Worst 5% final value": study.worst_final,
+    })
+    st.dataframe(rebalancing_table.style.format({
+        "Rebalances per year": "{:.1f}",
+        "Median fees paid": "{:,.0f}",
+        "Median drift from target (%)": "{:.1f}",
+        "Tracking error (%/year)": "{:.2f}",
+        "Median final value": "{:,.0f}",
+        "Worst 5% final value": "{:,.0f}",
+    }), hide_index=True)
+
+    st.scatter_chart(rebalancing_table, x="Median fees paid", y="Tracking error (%/year)", color="Rule",
+                     x_label="Median fees paid (turnover cost)", y_label="Tracking error (%/year)")
+
+    st.markdown(f"""The tracking error measures how far the returns of each rule stray from the ideal portfolio that holds exactly {stock_share}% stocks at all times, for free. Buy and hold never pays but drifts the most: with stocks growing faster, it usually ends with a higher median *and* more risk than you chose. Frequent calendars track perfectly and pay the most. Bands trade only when it matters, and usually get most of the tracking for a fraction of the fees.
+    """)
+
 st.divider()
 
 st.markdown("""
@@ -139,7 +218,7 @@ else:
 
 invested_hedge = calculate_compound_interest(initial_amount, hedge_fund_rate, year_range)
 
-hedge_dataframe = pd.DataFrame({
+hedge_dataframe = chart_frame({
     "Year": year_range,
     "Investment": invested_values,
     "Investment with fees": invested_fees_values,
@@ -204,7 +283,9 @@ with st.expander("⚙️ Settings"):
         benchmark = st.number_input("Benchmark (%)", value=4.0, step=0.1)
 
 
-years = years_work+years_retirement
+life_cycle = LifeCycle(job_savings, years_work, retirement_spending, years_retirement)
+fees = Fees(yearly_fees, transaction_fees, performance_fees, benchmark, wealth_tax, wealth_tax_threshold)
+years = life_cycle.years
 
 st.markdown(""" **👇 Interactive Scenario:**  
 Real life isn't linear. What if the market crashes right when you retire? What if you get a promotion or win the lottery?  
@@ -214,7 +295,7 @@ Real life isn't linear. What if the market crashes right when you retire? What i
 default_data = pd.DataFrame({
     "Year": range(1, years + 1),
     "Investment Rate (%)": [investment_rate] * years, # [3.0, 3.0, 3.0, 3.0, 3.0]
-    "Contribution": [job_savings] * years_work + [-retirement_spending] * years_retirement
+    "Contribution": life_cycle.yearly_contributions()
 })
 
 # if st.checkbox("Edit yearly contributions"):
@@ -226,7 +307,8 @@ default_data = st.data_editor(
     column_config={
         "Investment Rate (%)": st.column_config.NumberColumn(
             "Investment Rate (%)",
-            format="%.1f%%"
+            format="%.1f%%",
+            min_value=-99.9 # nothing is left to compound after a 100% loss
         ),
         "Contribution ($)": st.column_config.NumberColumn(
             "Contribution",
@@ -237,17 +319,16 @@ default_data = st.data_editor(
     num_rows="fixed" # Prevents user from adding/deleting rows (optional)
 )
 
-invested = [0]
-for i in range(1, years):
-    invested.append( (invested[-1]+default_data["Contribution"][i-1]) * (1 + default_data["Investment Rate (%)"][i-1]/100))
+contributions = default_data["Contribution"].to_numpy(dtype=float)
+rates = default_data["Investment Rate (%)"].to_numpy(dtype=float)
 
-invested_with_fees = [0]
-wealth_taxable = (1 if invested_with_fees[-1] > wealth_tax_threshold else 0)
+# editing one row only recomputes the years after it, the earlier ones are kept in the session
+invested = incremental_life_cycle_wealth(st.session_state.setdefault("fees_life_cycle", {}), contributions, 1 + rates/100)
 
-for i in range(1, years):
-    contribution = default_data["Contribution"][i-1]
-    contribution = contribution *(1-transaction_fees/100 * (1 if contribution > 0 else -1) ) # apply transaction fees with the correct sign when withdrawing
-    invested_with_fees.append( (invested_with_fees[-1] + contribution ) * (1 + default_data["Investment Rate (%)"][i-1]/100 - yearly_fees/100 - performance_fees/100 * max(0, default_data["Investment Rate (%)"][i-1]-benchmark)/100 - wealth_tax/100 * wealth_taxable) )
+# the fees depend on the wealth of each year (wealth tax threshold), so they are applied year by year
+# (the last row's flows fall after the end of the horizon, as above); an edit only replays the years after it
+fees_result = apply_fees_incremental(st.session_state.setdefault("fees_life_cycle_costs", {}), contributions[:-1], rates[:-1], fees)
+invested_with_fees = fees_result["wealth"]
 
 
 if min(invested_with_fees) < 0:
@@ -267,11 +348,140 @@ st.metric(
     delta_color="normal" # Makes the negative change red
 )
 
-default_data["Investment with Fees"] = invested_with_fees
-default_data["Investment without Fees"] = invested
+fees_dataframe = chart_frame({
+    "Year": time_axis(years, start=1),
+    "Investment with Fees": invested_with_fees[:years],
+    "Investment without Fees": invested[:years],
+})
 
+st.line_chart(fees_dataframe, x="Year", y=["Investment without Fees","Investment with Fees"], x_label="Years of investing", y_label="Investment Value Over Life", color=["#FF4B4B", "#32CD32"])
 
-st.line_chart(default_data[:years], x="Year", y=["Investment without Fees","Investment with Fees"], x_label="Years of investing", y_label="Investment Value Over Life", color=["#FF4B4B", "#32CD32"])
+st.markdown("""**Which fee costs you most?** Each bar is what the money taken by that fee would have become if it had stayed invested. Together they make the whole gap between the two curves.
+
+Real markets are not a fixed yield every year. Tick the box to replay your table on 5,000 volatile markets: performance fees and wealth tax hit hardest in the good years.
+""")
+
+col1, col2 = st.columns(2)
+with col1:
+    fees_volatility = st.checkbox("Add market volatility")
+with col2:
+    yearly_volatility = st.number_input("Investment Volatility (%/year)", value=15.0, step=1.0, disabled=not fees_volatility)
+
+@st.cache_data
+def run_fees_montecarlo(n_paths, contributions, rates, volatility, fees, seed=0):
+    returns = 100*generate_deltas_batch(n_paths, len(rates)+1, volatility/100, rates, rng=np.random.default_rng(seed))
+    result = apply_fees(contributions, returns, fees)
+    return {name: np.median(lost) for name, lost in result["lost"].items()}, np.median(result["wealth"][:, -1])
+
+if fees_volatility:
+    lost, median_wealth = run_fees_montecarlo(5000, contributions[:-1], rates[:-1], yearly_volatility, fees)
+    st.write(f"Median wealth at the end of retirement over 5,000 volatile markets: {median_wealth:,.1f}")
+else:
+    lost = fees_result["lost"]
+
+lost_dataframe = pd.DataFrame({
+    "Fee": FEE_COMPONENTS,
+    "Value lost": [lost[name] for name in FEE_COMPONENTS],
+})
+st.bar_chart(lost_dataframe, x="Fee", y="Value lost", x_label="", y_label="Value lost at the end of retirement", color="#FF4B4B")
+
+st.markdown("""### 🧾 The taxman: capital gains
+
+When you sell in retirement, the state takes its cut too, but only of the *gains*: the money you put in comes back tax free. The older your savings, the larger the gain part of each sale, so the tax depends on the whole history of each market scenario (the *cost basis*).
+
+Many countries also offer **tax-deferred** accounts (pension funds, 401k and the like): you save from your income before taxes, so the same effort puts more money to work, but everything you take out in retirement is taxed as income. Which one is better? Set the taxes below and press the button: your life cycle above, with its yearly fees, is replayed on 10,000 volatile markets, in both accounts.
+""")
+
+with st.form("Taxes"):
+    col1, col2 = st.columns(2)
+    with col1:
+        capital_gains_tax = st.number_input("Capital gains tax (%)", min_value=0.0, max_value=99.0, value=26.0, step=1.0)
+        work_income_tax = st.number_input("Income tax while working (%)", min_value=0.0, max_value=99.0, value=30.0, step=1.0)
+    with col2:
+        retirement_income_tax = st.number_input("Income tax in retirement (%)", min_value=0.0, max_value=99.0, value=20.0, step=1.0)
+        market_volatility = st.number_input("Investment Volatility (%/year)", min_value=0.0, value=15.0, step=1.0, key="tax_volatility")
+
+    # the comparison only runs once asked for, then follows the inputs of the page
+    if st.form_submit_button("Compare the accounts"):
+        st.session_state.taxes_requested = True
+
+taxes = Taxes(capital_gains_tax, work_income_tax, retirement_income_tax)
+# the volatility is per year, the market model takes it per month
+market = MarketModel(investment_rate, market_volatility/np.sqrt(12))
+
+# 10,000 paths: a fraction of a second, computed once per set of inputs
+@st.cache_data(max_entries=8)
+def run_after_tax(life_cycle, market, taxes, yearly_fees):
+    return after_tax_comparison(life_cycle, market, taxes, yearly_fees)
+
+if st.session_state.get("taxes_requested"):
+    after_tax = run_after_tax(life_cycle, market, taxes, yearly_fees)
+
+    tax_dataframe = chart_frame({"Year": time_axis(life_cycle.years + 1)} | {account: after_tax.bands[i, 1] for i, account in enumerate(TAX_ACCOUNTS)})
+    st.line_chart(tax_dataframe, x="Year", y=TAX_ACCOUNTS, x_label="Years of investing", y_label="Median wealth after taxes")
+
+    tax_table = pd.DataFrame({
+        "Account": TAX_ACCOUNTS,
+        "Median final wealth": after_tax.median_final,
+        "Median taxes paid": after_tax.median_taxes,
+        "Median tax still due on the final wealth": after_tax.median_tax_due,
+        "Money lasts (%)": 100*after_tax.success_probability,
+    })
+    st.dataframe(tax_table.style.format({
+        "Median final wealth": "{:,.0f}",
+        "Median taxes paid": "{:,.0f}",
+        "Median tax still due on the final wealth": "{:,.0f}",
+        "Money lasts (%)": "{:.1f}",
+    }), hide_index=True)
+
+    st.markdown("""The tax-deferred account wins when your tax rate in retirement is lower than while working (the usual case, since you earn less), and loses when it is higher. The taxable account pays little at the start of retirement, when most of each sale is your own money coming back, and more and more as only gains are left.
+""")
+
+st.markdown(f"""**📌 1% or 0.2%?** Pin your current life cycle, change the yearly fees (or anything else above) and compare: the pinned scenarios (up to {MAX_PINNED}) and the current one are simulated together on the same volatile markets, so the gaps come only from your inputs. Only the yearly fees are taken into account here, and the markets have the volatility set for the taxes.
+""")
+
+def scenario_label(life_cycle, market, fees):
+    return (f"fees {fees.yearly_fees:g}%, {market.rate:g}% return, save {life_cycle.job_savings:,.0f} for {life_cycle.years_work}y, "
+            f"spend {life_cycle.retirement_spending:,.0f} for {life_cycle.years_retirement}y")
+
+current_scenario = (life_cycle, market, Fees(yearly_fees))
+pinned = st.session_state.setdefault("fees_pinned", [])
+
+# callbacks run before the page, so the buttons below are drawn with the updated pins
+col1, col2 = st.columns(2)
+with col1:
+    st.button("📌 Pin this scenario", disabled=len(pinned) >= MAX_PINNED or current_scenario in pinned,
+              on_click=pinned.append, args=(current_scenario,))
+with col2:
+    st.button("🗑️ Clear pinned scenarios", disabled=not pinned, on_click=pinned.clear)
+
+# the current scenario first: it is the reference of the differences
+scenario_set = tuple([current_scenario] + [scenario for scenario in pinned if scenario != current_scenario])
+
+@st.cache_data(max_entries=16)
+def run_scenario_set(scenarios, n_paths=MAX_COMPARED_PATHS):
+    return scenario_set_comparison(scenarios, n_paths)
+
+if len(scenario_set) > 1:
+    compared = run_scenario_set(scenario_set)
+    labels = ["Current: " + scenario_label(*scenario_set[0])] + [f"Pinned {i}: " + scenario_label(*scenario) for i, scenario in enumerate(scenario_set[1:], 1)]
+
+    scenario_dataframe = chart_frame({"Year": time_axis(compared.bands.shape[-1], 12)} | {label: compared.bands[i, 1] for i, label in enumerate(labels)})
+    st.line_chart(scenario_dataframe, x="Year", y=labels, x_label="Years of investing", y_label="Median wealth")
+
+    scenario_table = pd.DataFrame({
+        "Scenario": labels,
+        "Median final wealth": compared.median_final,
+        "Worst 5% final wealth": compared.worst_final,
+        "Money lasts (%)": 100*compared.success_probability,
+        "Difference with current (same markets, median)": compared.median_difference,
+    })
+    st.dataframe(scenario_table.style.format({
+        "Median final wealth": "{:,.0f}",
+        "Worst 5% final wealth": "{:,.0f}",
+        "Money lasts (%)": "{:.1f}",
+        "Difference with current (same markets, median)": "{:,.0f}",
+    }), hide_index=True)
 
 st.markdown("""### 📝  Final thoughts
 Yearly fees are the silent killer of your investments. Even seemingly small fees can have a huge impact over time due to the power of compound interest. While in a no-fees scenario you might be able to retire comfortably and even accumulate such wealth to be able to retire early and live off passive income without eroding your wealth, even just 2% yearly fees might make it impossible to retire! Over a lifetime, every fraction of a percent makes up for a Ferrari that your advisor gets instead of you!
@@ -5,7 +5,11 @@ import plotly.express as px
 import plotly.graph_objects as go
 
 
-from utils import calculate_compound_interest, generate_paths, compounding_frequency_adjusted, generate_deltas
+from dataclasses import replace
+
+from utils import calculate_compound_interest, invest_cashflows, z_score, probability_standard_error, percentile_confidence_interval, prefetch, neighbor_values, next_value, generate_paths, compounding_frequency_adjusted, refine_paths, calculate_risk_metrics, CONTRIBUTION_STRATEGIES, linear_glide_path, step_glide_path, table_glide_path
+from compute import MarketModel, LifeCycle, Fees, GlidePath, WithdrawalPolicy, annual_paths, montecarlo_size, contribution_strategies, glide_path_comparison, withdrawal_comparison, scenario_set_comparison, MAX_PINNED, MAX_STRATEGY_PATHS, MAX_COMPARED_PATHS
+from chart_data import time_axis, chart_frame
 
 st.title("Nothing ventured, nothing gained")
 st.subheader("Nothing in life is without risk")
@@ -62,13 +66,12 @@ with col5:
     if st.button("Make another simulation"):
         seed = False
 
-year_range = list(range(12*years+1))
 investment_rate = compounding_frequency_adjusted(investment_rate, 12)
-invested_values = calculate_compound_interest(initial_amount, investment_rate, year_range)
+invested_values = calculate_compound_interest(initial_amount, investment_rate, time_axis(12*years+1))
 invested_volatility = generate_paths(12*years+1, investment_volatility/100, investment_rate, start_val=initial_amount)
-year_range = [yr/12 for yr in year_range]
+year_range = time_axis(12*years+1, 12)
 
-Fees_dataframe = pd.DataFrame({
+Fees_dataframe = chart_frame({
     "Year": year_range,
     "Investment": invested_values,
     "Investment with volatility": invested_volatility 
@@ -147,7 +150,7 @@ investment_rate = compounding_frequency_adjusted(st.session_state.roi, 12)
 invested_values = calculate_compound_interest(initial_amount, risk_free_rate, year_range)
 invested_volatility = generate_paths(12*years+1, st.session_state.volatility/100, investment_rate, start_val=initial_amount)
 
-Fees_dataframe = pd.DataFrame({
+Fees_dataframe = chart_frame({
     "Year": year_range,
     "Investment": invested_values,
     "Investment with volatility": invested_volatility 
@@ -172,16 +175,39 @@ This leads to the most important concept in investing: time is your friend.
 Over 1 year, the stock market is almost a casino. You can make money or lose it.
 Over 20 years, the stock market has (historically) never lost money. Assuming you invested correctly (i.e. in the [total market](/tvm) with [low fees](/fees))
 
-Run 100 simulations below. Watch how the "Probability of Loss" collapses as you compare short and long term.
+Run the simulations below. Watch how the "Probability of Loss" collapses as you compare short and long term.
+
+Simulations are not exact either: with few runs, the tails of the distribution are a matter of luck. A quick pilot run estimates how precise every statistic is, and the simulation then uses just enough runs to reach the precision you ask for. The ± next to each number is its 95% confidence interval.
 """)
 
+# how precise the statistics should be: probabilities within ± tolerance, percentiles within ± tolerance of their value
+PRECISION = {"Rough": 0.05, "Good": 0.02, "Precise": 0.01}
+
+# pilot run: how many simulations make every probability and every 5/50/95 percentile precise enough?
+@st.cache_data
+def choose_montecarlo_size(market, years, initial_amount, risk_free_rate, tolerance):
+    return montecarlo_size(market, years, initial_amount, risk_free_rate, tolerance)
+
+# only the yearly values are needed for the statistics: one random draw per year and path
+@st.cache_data
+def run_montecarlo(market, years, n_sims, initial_amount):
+    return annual_paths(market, years, n_sims, initial_amount)
+
+# monthly detail only for the few paths that are drawn
 @st.cache_data
-def run_montecarlo(n_sims, time, volatility, rate, initial_amount):
+def refine_montecarlo(paths, volatility, path_index, years):
+    return refine_paths(paths, volatility, path_index, 0, years, steps_per_year=12)
 
-    paths = []
-    for i in range(n_sims):
-        paths.append(generate_paths(time, volatility, rate, start_val=initial_amount))
-    return paths
+# every risk number of every horizon at once, against the risk-free investment
+@st.cache_data
+def run_risk_metrics(paths, initial_amount, risk_free_rate):
+    horizons = np.arange(1, paths.shape[1])
+    risk = calculate_risk_metrics(paths[:, 1:], initial_amount, confidence=(0.9, 0.95),
+                                  target=calculate_compound_interest(initial_amount, risk_free_rate, horizons))
+    # VaR 95% is the initial amount minus the 5th percentile
+    _, lower, upper = percentile_confidence_interval(paths[:, 1:], 5)
+    risk["VaR error"] = (upper[0] - lower[0])/2
+    return risk
 
 with st.form("Risk and Return simulation"):
     col1, col2 = st.columns(2)
@@ -189,6 +215,8 @@ with st.form("Risk and Return simulation"):
         investment_rate = st.number_input("Investment Return (%)", value=7.0, step=0.1, key="mc_rate")
     with col2:
         investment_volatility = st.number_input("Investment Volatility (%/month)", value=2., key="mc_volatility")
+
+    precision = st.select_slider("Precision of the statistics", options=list(PRECISION.keys()), value="Good", key="mc_precision")
         
     # The button that triggers the update
     calculate_btn = st.form_submit_button("Run Simulation")
@@ -199,15 +227,17 @@ with col3:
 
 initial_amount = 1000
 years = 50
-investment_rate = compounding_frequency_adjusted(investment_rate, 12)
+market = MarketModel(investment_rate, investment_volatility)
 
-paths = run_montecarlo(100, 12*years+1, investment_volatility/100, investment_rate, initial_amount)
+n_sims = choose_montecarlo_size(market, years, initial_amount, risk_free_rate, PRECISION[precision])
+paths = run_montecarlo(market, years, n_sims, initial_amount)
 
-year1 = []
-year50 = []
-for p in paths:
-    year1.append(p[12*comparison_year])
-    year50.append(p[-1])
+year1 = paths[:, comparison_year]
+year50 = paths[:, -1]
+risk = run_risk_metrics(paths, initial_amount, risk_free_rate)
+# 95% confidence half-widths of the probabilities
+loss_error = z_score()*probability_standard_error(risk["Loss probability"], n_sims)
+shortfall_error = z_score()*probability_standard_error(risk["Shortfall probability"], n_sims)
 
 # make a histogram in streamlit
 col1, col2 = st.columns(2)
@@ -215,12 +245,12 @@ with col1:
     # counts, bin_edges = np.histogram(year1, bins=5)
 
     # how many values are below initial amount
-    below_initial = sum(1 for v in year1 if v < initial_amount)
-    below_risk_free = sum(1 for v in year1 if v < calculate_compound_interest(initial_amount, risk_free_rate, comparison_year))
-    st.write(f"""After {comparison_year} years, out of 100 simulations, 
-- {below_initial} are below initial amount, {np.min(year1):.2f} being the lowest.
-- {below_risk_free} are below 3% risk-free amount.
-- {np.max(year1):.2f} is the most successful simulation.""")
+    below_initial = round(n_sims*risk["Loss probability"][comparison_year-1])
+    below_risk_free = round(n_sims*risk["Shortfall probability"][comparison_year-1])
+    st.write(f"""After {comparison_year} years, out of {n_sims} simulations, 
+- {below_initial} ({100*risk["Loss probability"][comparison_year-1]:.1f}% ± {100*loss_error[comparison_year-1]:.1f}%) are below initial amount, {risk["Min"][comparison_year-1]:.2f} being the lowest.
+- {below_risk_free} ({100*risk["Shortfall probability"][comparison_year-1]:.1f}% ± {100*shortfall_error[comparison_year-1]:.1f}%) are below 3% risk-free amount.
+- {risk["Max"][comparison_year-1]:.2f} is the most successful simulation.""")
 
     fig = px.histogram(
         year1, 
@@ -242,7 +272,7 @@ with col1:
 
     # This forces the bars to have a thin white gap (looks more professional)
     fig.update_traces(marker_line_width=1.5, marker_line_color="white")
-    fig.update_xaxes(range=[min(np.min(year1)*0.95, initial_amount), np.max(year1)*1.05])
+    fig.update_xaxes(range=[min(risk["Min"][comparison_year-1]*0.95, initial_amount), risk["Max"][comparison_year-1]*1.05])
     # Add a vertical line for the Mean or Median
     # fig.add_vline(x=np.mean(year1), line_width=5, line_dash="dash", line_color="red", opacity=1.0)
 
@@ -265,14 +295,14 @@ with col2:
     # st.write("Distribution of Portfolio Values After 50 Years")
     # st.write(f"Mean: {np.mean(year50):.2f}, Std Dev: {np.std(year50):.2f}")
     # counts, bin_edges = np.histogram(year50, bins=5)
-    below_initial = sum(1 for v in year50 if v < initial_amount)
-    below_risk_free = sum(1 for v in year50 if v < calculate_compound_interest(initial_amount, risk_free_rate, 50))
+    below_initial = round(n_sims*risk["Loss probability"][-1])
+    below_risk_free = round(n_sims*risk["Shortfall probability"][-1])
 
 
-    st.write(f"""After 50 years, out of 100 simulations, 
-- {below_initial} are below initial amount, {np.min(year50):.2f} being the lowest.
-- {below_risk_free} are below 3% risk-free amount.
-- {np.max(year50):.2f} is the most successful simulation.""")
+    st.write(f"""After 50 years, out of {n_sims} simulations, 
+- {below_initial} ({100*risk["Loss probability"][-1]:.1f}% ± {100*loss_error[-1]:.1f}%) are below initial amount, {risk["Min"][-1]:.2f} being the lowest.
+- {below_risk_free} ({100*risk["Shortfall probability"][-1]:.1f}% ± {100*shortfall_error[-1]:.1f}%) are below 3% risk-free amount.
+- {risk["Max"][-1]:.2f} is the most successful simulation.""")
 
     fig = px.histogram(
         year50, 
@@ -304,6 +334,49 @@ with col2:
 
     st.plotly_chart(fig, use_container_width=True)
 
+with st.expander("📋 Risk table for every horizon"):
+    st.markdown("""
+- **VaR 95%**: the loss (from the initial amount) that only 5% of the simulations exceed.
+- **CVaR 95%**: the average loss in those worst 5%.
+- **Sortino ratio**: the extra return over the risk-free investment, divided by the size of the shortfalls only.
+- **Omega ratio**: how much you gain above the risk-free investment for every 1 you fall short of it.
+""")
+    risk_table = pd.DataFrame({
+        "Year": np.arange(1, years+1),
+        "Below initial (%)": 100*risk["Loss probability"],
+        "Below initial ± (%)": 100*loss_error,
+        "Below risk-free (%)": 100*risk["Shortfall probability"],
+        "Below risk-free ± (%)": 100*shortfall_error,
+        "VaR 90%": risk["VaR"][0],
+        "VaR 95%": risk["VaR"][1],
+        "VaR 95% ±": risk["VaR error"],
+        "CVaR 95%": risk["CVaR"][1],
+        "Sortino ratio": risk["Sortino"],
+        "Omega ratio": risk["Omega"],
+    })
+    st.dataframe(risk_table.style.format({
+        "Below initial (%)": "{:.0f}",
+        "Below initial ± (%)": "{:.1f}",
+        "Below risk-free (%)": "{:.0f}",
+        "Below risk-free ± (%)": "{:.1f}",
+        "VaR 90%": "{:,.0f}",
+        "VaR 95%": "{:,.0f}",
+        "VaR 95% ±": "{:,.0f}",
+        "CVaR 95%": "{:,.0f}",
+        "Sortino ratio": "{:.2f}",
+        "Omega ratio": "{:.2f}",
+    }), hide_index=True)
+
+# a few of the simulations, month by month, up to the chosen horizon
+sample_paths = refine_montecarlo(paths, investment_volatility/100, list(range(5)), comparison_year)
+# while the chart is on screen, get the nearby horizons ready in the background
+st.session_state.mc_prefetch = prefetch(refine_montecarlo,
+                                        [(paths, investment_volatility/100, list(range(5)), y) for y in neighbor_values(comparison_year, 1, 10)],
+                                        st.session_state.get("mc_prefetch"))
+sample_names = [f"Simulation {i+1}" for i in range(len(sample_paths))]
+sample_dataframe = chart_frame({"Year": time_axis(sample_paths.shape[1], 12), **dict(zip(sample_names, sample_paths))})
+st.line_chart(sample_dataframe, x="Year", y=sample_names, x_label="Year", y_label="Investment value")
+
 st.markdown("""
 ###  Takeaway message: 
 - If you need the money in 2 years, the stock market is dangerous.
@@ -320,7 +393,7 @@ Now that we understand volatility better, let's see how it affects the simulatio
             
 During working years, you put automatically money in the market every month, buying the corresponding number of shares. This is called dollar-cost averaging and it automatically reduces the effect of volatility. When the market is down, you buy more shares, that will appreciate even more later on.
             
-In the following, we run 100 simulations of a financial life cycle with different volatility scenarios, and see how it affects the wealth over time. The blue band shows where 90% of the simulations lie. The default 3% risk free investment (inflation adjusted) is quite optimistic and shown for comparison. As always, you can adjust all the parameters and run your own scenario.
+In the following, we run simulations of a financial life cycle (as many as the precision in the settings requires) with different volatility scenarios, and see how it affects the wealth over time. The blue band shows where 90% of the simulations lie. The default 3% risk free investment (inflation adjusted) is quite optimistic and shown for comparison. As always, you can adjust all the parameters and run your own scenario.
 """)
 
 with st.form("Retirement Simulation with volatility"):
@@ -351,72 +424,49 @@ with st.form("Retirement Simulation with volatility"):
         with opt_col2:
             years_retirement = st.slider("Retirement (Years)", min_value=0, max_value=70, value=30)
 
+        precision_delta = st.select_slider("Precision of the statistics", options=list(PRECISION.keys()), value="Good", key="delta_precision")
+
                     
     # The button that triggers the update
     calculate_btn = st.form_submit_button("Run Simulation")
 
 years = years_work + years_retirement
 
-year_range = list(range(12*years+1))
-investment_rate = compounding_frequency_adjusted(investment_rate, 12)
 rf_rate = compounding_frequency_adjusted(rf_rate, 12)
 
-@st.cache_data
-def run_montecarlo_delta(n_sims, time, volatility, rate):
+life_cycle = LifeCycle(job_savings, years_work, retirement_spending, years_retirement)
+market = MarketModel(investment_rate, investment_volatility)
+tolerance = PRECISION[precision_delta]
 
-    paths = []
-    for i in range(n_sims):
-        paths.append(generate_deltas(time, volatility, rate))
-    return paths
+# the whole life cycle for one set of inputs: the strategies are replayed on the simulated markets
+# and only the bands, the final values and the gains are kept in the cache
+@st.cache_data(max_entries=16)
+def run_contribution_strategies(life_cycle, market, tolerance):
+    return contribution_strategies(life_cycle, market, tolerance)
 
-contributions = [job_savings/12] * (years_work*12) + [-retirement_spending/12] * (years_retirement*12)
+contributions = life_cycle.monthly_contributions()
 total_contributions = job_savings*years_work
-# total_contributions_value = total_contributions/calculate_compound_interest(1, investment_rate, years_work)/2.
-
-delta_paths = run_montecarlo_delta(100, 12*years+1, investment_volatility/100, investment_rate)
-
-monthly_paths = []
-for delta in delta_paths:
-    invested = [0]
-    for i in range(1,12*years):
-        invested.append( (invested[-1]+contributions[i-1]) * (1 + delta[i-1]))
-    monthly_paths.append(invested)
-
-monthly_paths = np.asarray(monthly_paths)
 
-# lump_paths =[]
-# for delta in delta_paths:
-#     invested = [total_contributions_value]
-#     for i in range(1,12*years):
-#         invested.append( (invested[-1]) * (1 + delta[i-1]))
-#     lump_paths.append(invested)
+strategies = run_contribution_strategies(life_cycle, market, tolerance)
+n_sims_delta = strategies.n_paths
+lower_bound, median_path, upper_bound = strategies.bands
+lump_median = strategies.lump_median
 
-# lump_median = np.median(lump_paths, axis=0)
-
-median_path = np.median(monthly_paths, axis=0)
-lower_bound = np.percentile(monthly_paths, 5, axis=0)
-upper_bound = np.percentile(monthly_paths, 95, axis=0)
+# the next run will likely move the work life one more year the same way: simulate it in the background.
+# A single run, as large as the one just drawn, so that moving the slider at most doubles the memory in use
+st.session_state.delta_prefetch = prefetch(run_contribution_strategies,
+                                           [(replace(life_cycle, years_work=y), market, tolerance)
+                                            for y in next_value(years_work, st.session_state.get("delta_years_work"), 10, 50)],
+                                           st.session_state.get("delta_prefetch"))
+st.session_state.delta_years_work = years_work
 
 # st.write(risk_free_rate, median_path)
 
-default_data = pd.DataFrame({
-    "Year": [yr/12 for yr in range(1, 12*years + 1)],
-    "Median Investment Rate (%)": median_path, # [3.0, 3.0, 3.0, 3.0, 3.0]
-    "Lower Bound Rate (%)": lower_bound,
-    "Upper Bound Rate (%)": upper_bound,
-    "Contribution": contributions
-})
-
-# add column to dataframe
-default_data["Investment Value"] = median_path
-default_data["Lower Bound"] = lower_bound
-default_data["Upper Bound"] = upper_bound
-
-invested_rf = [0]
-for i in range(1, 12*years):
-    invested_rf.append( (invested_rf[-1]+default_data["Contribution"][i-1]) * (1 + rf_rate/100))
+# one point per month after the start, the bands are plotted as they come from the simulation
+month_years = time_axis(12*years, 12, start=1)
 
-default_data["Risk-Free Investment"] = invested_rf
+# same contributions at the risk-free rate (the last month's flow falls after the horizon)
+invested_rf = invest_cashflows(np.full(12*years-1, 1 + rf_rate/100), contributions[:12*years-1])
 
 
 
@@ -432,23 +482,23 @@ default_data["Risk-Free Investment"] = invested_rf
 #     st.success("🎉 Success: Your investments last through retirement!")
 
 
-# st.line_chart(default_data, x="Year", y=["Investment Value", "Risk-Free Investment"], x_label="Year", y_label="Investment value", color=["#32CD32", "#FF4B4B"])
+# st.line_chart(x="Year", y=["Investment Value", "Risk-Free Investment"], x_label="Year", y_label="Investment value", color=["#32CD32", "#FF4B4B"])
 
 
 # Plotly line chart with fill between for volatility
 fig = go.Figure()
 
 fig.add_trace(go.Scatter(
-    x=default_data["Year"],
-    y=default_data["Investment Value"],
+    x=month_years,
+    y=median_path,
     mode='lines',
     name='Median Monthly Investment Outcome',
     line=dict(color='rgb(0, 100, 255)', width=3)
 ))
 
 fig.add_trace(go.Scatter(
-    x=default_data["Year"],
-    y=default_data["Upper Bound"],
+    x=month_years,
+    y=upper_bound,
     mode='lines',
     line=dict(width=0), # No line
     showlegend=False,
@@ -456,8 +506,8 @@ fig.add_trace(go.Scatter(
 ))
 
 fig.add_trace(go.Scatter(
-    x=default_data["Year"],
-    y=default_data["Lower Bound"],
+    x=month_years,
+    y=lower_bound,
     mode='lines',
     line=dict(width=0), # No line
     fill='tonexty',     # <--- Fills area between this trace and the previous one
@@ -467,20 +517,20 @@ fig.add_trace(go.Scatter(
 ))
 
 fig.add_trace(go.Scatter(
-    x=default_data["Year"],
-    y=default_data["Risk-Free Investment"],
+    x=month_years,
+    y=invested_rf,
     mode='lines',
     line=dict(color='#32CD32'), # Solid Blue
     name='Volatility-Free Outcome'
 ))
 
-# fig.add_trace(go.Scatter(
-#     x=default_data["Year"],
-#     y=lump_median,
-#     mode='lines',
-#     line=dict(color='#32CD32'), # Solid Blue
-#     name='Lump Sum Outcome'
-# ))
+fig.add_trace(go.Scatter(
+    x=month_years,
+    y=lump_median,
+    mode='lines',
+    line=dict(color='#FFA500', dash='dash'),
+    name='Median Lump Sum Outcome'
+))
 
 # 3. LAYOUT POLISH
 fig.update_layout(
@@ -509,13 +559,290 @@ st.write(f"""
 if invested_rf[-1] >= 0:
     st.write(f"- Investing only on bonds without volatility gives {invested_rf[-1]:.2f} real currency, lasting through retirment 🎉")
 else:
-    st.write(f"- Investing only on volatility-free bonds runs out of money after {(next(i for i, v in enumerate(invested_rf) if v < 0)/12)-years_work:.1f} years of retirement ⚠️")
+    st.write(f"- Investing only on volatility-free bonds runs out of money after {np.argmax(invested_rf < 0)/12-years_work:.1f} years of retirement ⚠️")
+
+# 95% confidence half-widths of the final 5/50/95 percentiles
+_, final_lower, final_upper = percentile_confidence_interval(strategies.final, [5, 50, 95])
+final_error = (final_upper - final_lower)/2
 
-st.write(f"""- Despite the volatility, investing with monthly contributions gives a median outcome of {median_path[-1]/1000.:.0f} thousands real currency after retirement, that means that half scenarios will be above that and half below.
-- 90% of scenarios will end up between from {lower_bound[-1]/1000.:.0f} thousands to {upper_bound[-1]/1000.:.0f} thousands real currency.""")
+st.write(f"""- Despite the volatility, investing with monthly contributions gives a median outcome of {median_path[-1]/1000.:.0f} (± {final_error[1]/1000.:.0f}) thousands real currency after retirement, that means that half scenarios will be above that and half below.
+- 90% of scenarios will end up between from {lower_bound[-1]/1000.:.0f} (± {final_error[0]/1000.:.0f}) thousands to {upper_bound[-1]/1000.:.0f} (± {final_error[2]/1000.:.0f}) thousands real currency.
+- These numbers come from {n_sims_delta:,} simulations{" (the maximum: more precision would need more than that)" if n_sims_delta == MAX_STRATEGY_PATHS else ""}: enough for the chances of beating monthly investing within ± {100*tolerance:g}% and the median within ± {100*tolerance:g}% of the 5-95% range.""")
 
 st.plotly_chart(fig, use_container_width=True)
 
+st.markdown(f"""**📌 What if?** Pin this scenario, change the inputs above and run again: the pinned scenarios (up to {MAX_PINNED}) are simulated together with the current one, on the same markets, so the differences below come only from the inputs.
+""")
+
+def scenario_label(life_cycle, market, fees):
+    return (f"{market.rate:g}% ± {market.volatility:g}%/month, save {life_cycle.job_savings:,.0f} for {life_cycle.years_work}y, "
+            f"spend {life_cycle.retirement_spending:,.0f} for {life_cycle.years_retirement}y")
+
+current_scenario = (life_cycle, market, Fees())
+pinned = st.session_state.setdefault("risk_pinned", [])
+
+# callbacks run before the page, so the buttons below are drawn with the updated pins
+col1, col2 = st.columns(2)
+with col1:
+    st.button("📌 Pin this scenario", disabled=len(pinned) >= MAX_PINNED or current_scenario in pinned,
+              on_click=pinned.append, args=(current_scenario,))
+with col2:
+    st.button("🗑️ Clear pinned scenarios", disabled=not pinned, on_click=pinned.clear)
+
+# the current scenario first: it is the reference of the differences
+scenario_set = tuple([current_scenario] + [scenario for scenario in pinned if scenario != current_scenario])
+
+@st.cache_data(max_entries=16)
+def run_scenario_set(scenarios, n_paths):
+    return scenario_set_comparison(scenarios, n_paths)
+
+if len(scenario_set) > 1:
+    compared = run_scenario_set(scenario_set, min(n_sims_delta, MAX_COMPARED_PATHS))
+    labels = ["Current: " + scenario_label(*scenario_set[0])] + [f"Pinned {i}: " + scenario_label(*scenario) for i, scenario in enumerate(scenario_set[1:], 1)]
+
+    fig = go.Figure()
+    for label, (lower, median, upper) in zip(labels, compared.bands):
+        fig.add_trace(go.Scatter(x=time_axis(compared.bands.shape[-1], 12), y=median, mode='lines', name=label))
+    fig.update_layout(
+        title="Median wealth of the pinned scenarios",
+        xaxis_title="Years",
+        yaxis_title="Portfolio Value",
+        template="simple_white",
+        hovermode="x unified",
+        legend=dict(yanchor="top", y=0.99, xanchor="left", x=0.01, bgcolor="rgba(255, 255, 255, 0.5)")
+    )
+    st.plotly_chart(fig, use_container_width=True)
+
+    scenario_table = pd.DataFrame({
+        "Scenario": labels,
+        "Median final wealth": compared.median_final,
+        "Worst 5% final wealth": compared.worst_final,
+        "Money lasts (%)": 100*compared.success_probability,
+        "Difference with current (same markets, median)": compared.median_difference,
+    })
+    st.dataframe(scenario_table.style.format({
+        "Median final wealth": "{:,.0f}",
+        "Worst 5% final wealth": "{:,.0f}",
+        "Money lasts (%)": "{:.1f}",
+        "Difference with current (same markets, median)": "{:,.0f}",
+    }), hide_index=True)
+
+st.markdown(f"""
+### 🤔 Monthly, all at once, or by target?
+
+The dashed line shows what happens if, instead of investing monthly, you had invested on day one the *present value* of all your savings (the same amount, in expected-return terms). A third strategy, **value averaging**, invests whatever is needed each month to stay on the expected growth path: more after a drop, less (or even selling) after a rally.
+
+All three strategies use exactly the same {n_sims_delta} simulated markets, so the comparison is fair: the only difference is how the money goes in.
+""")
+
+gain = strategies.gain
+gain_estimate, gain_lower, gain_upper = percentile_confidence_interval(gain.T, [50, 5])
+comparison = pd.DataFrame({
+    "Strategy": CONTRIBUTION_STRATEGIES,
+    "Median gain": gain_estimate[0],
+    "Median gain ±": (gain_upper[0] - gain_lower[0])/2,
+    "Worst 5% gain": gain_estimate[1],
+    "Worst 5% gain ±": (gain_upper[1] - gain_lower[1])/2,
+    "Beats monthly investing (%)": 100*strategies.win_rate,
+    "Beats monthly investing ± (%)": 100*z_score()*probability_standard_error(strategies.win_rate, n_sims_delta),
+})
+st.dataframe(comparison.style.format({
+    "Median gain": "{:,.0f}",
+    "Median gain ±": "{:,.0f}",
+    "Worst 5% gain": "{:,.0f}",
+    "Worst 5% gain ±": "{:,.0f}",
+    "Beats monthly investing (%)": "{:.0f}",
+    "Beats monthly investing ± (%)": "{:.1f}",
+}), hide_index=True)
+
+fig = px.histogram(
+    pd.DataFrame({name: gain[i] - gain[0] for i, name in enumerate(CONTRIBUTION_STRATEGIES) if i > 0}),
+    nbins=30,
+    barmode="overlay",
+    title="Gain difference with monthly investing",
+    labels={'value': 'Final gain minus monthly investing gain', 'count': 'Frequency', 'variable': 'Strategy'},
+    opacity=0.6,
+    template="simple_white"
+)
+fig.add_vline(x=0, line_width=4, line_dash="solid", line_color="red")
+st.plotly_chart(fig, use_container_width=True)
+
+st.markdown("""
+### 🛝 Glide paths: less stocks as you get older
+
+So far all the money stays in the same volatile investment for the whole life. The classic advice is different: lots of stocks when you are young, and a growing share of bonds as retirement gets closer, so that a crash right before you stop working cannot hurt that much. This age-based schedule is called a *glide path*.
+
+Below you can compare a few of them on the same life cycle as above: a constant allocation, one that moves a bit every year (linear), one that moves every few years (step), and your own in the table (each row holds from its year until the next one). The stocks are the investment above, the bonds are calmer and yield less. All glide paths are invested on exactly the same simulated markets.
+""")
+
+with st.form("Glide paths"):
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        bond_rate = st.number_input("Bond Yield (after fees) (%).", value=2.0, step=0.1)
+
+    with col2:
+        bond_volatility = st.number_input("Bond Volatility (%/month).", value=0.5, step=0.1)
+
+    with col3:
+        correlation = st.number_input("Stock-bond correlation", min_value=-0.9, max_value=0.9, value=0.0, step=0.1)
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        start_share = st.slider("Stocks when you start working (%)", min_value=0, max_value=100, value=100, step=5)
+
+    with col2:
+        end_share = st.slider("Stocks at retirement (%)", min_value=0, max_value=100, value=40, step=5)
+
+    with col3:
+        step_years = st.slider("Years between steps", min_value=1, max_value=20, value=10)
+
+    custom_table = st.data_editor(
+        pd.DataFrame({"Year": [0, 20, 30, 40, 50], "Stocks (%)": [100, 90, 70, 50, 40]}),
+        num_rows="dynamic",
+        hide_index=True,
+        column_config={
+            "Year": st.column_config.NumberColumn(min_value=0, max_value=120, step=1, required=True),
+            "Stocks (%)": st.column_config.NumberColumn(min_value=0, max_value=100, step=5, required=True),
+        },
+    )
+
+    st.form_submit_button("Compare glide paths")
+
+custom_table = custom_table.dropna()
+glide_paths = (
+    GlidePath("Constant", tuple(np.full(years, float(start_share)).tolist())),
+    GlidePath("Linear", tuple(linear_glide_path(start_share, end_share, years_work, years_retirement).tolist())),
+    GlidePath("Step", tuple(step_glide_path(start_share, end_share, years_work, years_retirement, step_years).tolist())),
+)
+if len(custom_table):
+    glide_paths += (GlidePath("Your table", tuple(table_glide_path(custom_table["Year"], custom_table["Stocks (%)"], years).tolist())),)
+
+bonds = MarketModel(bond_rate, bond_volatility)
+
+# the assets are drawn once per set of inputs, each glide path only reweights them
+@st.cache_data(max_entries=16)
+def run_glide_paths(life_cycle, stocks, bonds, glide_paths, n_paths, correlation):
+    return glide_path_comparison(life_cycle, stocks, bonds, glide_paths, n_paths, correlation)
+
+glides = run_glide_paths(life_cycle, market, bonds, glide_paths, min(n_sims_delta, MAX_COMPARED_PATHS), correlation)
+
+st.line_chart(
+    chart_frame({"Year": time_axis(years)} | {glide_path.name: np.asarray(glide_path.stock_shares) for glide_path in glide_paths}),
+    x="Year", y=[glide_path.name for glide_path in glide_paths], x_label="Year", y_label="Stocks (%)")
+
+fig = go.Figure()
+for glide_path, (lower, median, upper) in zip(glide_paths, glides.bands):
+    fig.add_trace(go.Scatter(x=month_years, y=median, mode='lines', name=glide_path.name))
+fig.update_layout(
+    title="Median wealth of every glide path",
+    xaxis_title="Years",
+    yaxis_title="Portfolio Value",
+    template="simple_white",
+    hovermode="x unified"
+)
+st.plotly_chart(fig, use_container_width=True)
+
+_, glide_lower, glide_upper = percentile_confidence_interval(glides.final.T, [50, 5])
+glide_table = pd.DataFrame({
+    "Glide path": [glide_path.name for glide_path in glide_paths],
+    "Median final wealth": glides.bands[:, 1, -1],
+    "Median ±": (glide_upper[0] - glide_lower[0])/2,
+    "Worst 5% final wealth": glides.bands[:, 0, -1],
+    "Worst 5% ±": (glide_upper[1] - glide_lower[1])/2,
+    "Money lasts (%)": 100*glides.success_probability,
+    "Money lasts ± (%)": 100*z_score()*probability_standard_error(glides.success_probability, glides.n_paths),
+})
+st.dataframe(glide_table.style.format({
+    "Median final wealth": "{:,.0f}",
+    "Median ±": "{:,.0f}",
+    "Worst 5% final wealth": "{:,.0f}",
+    "Worst 5% ±": "{:,.0f}",
+    "Money lasts (%)": "{:.0f}",
+    "Money lasts ± (%)": "{:.1f}",
+}), hide_index=True)
+
+st.markdown(f"""
+###  Takeaway message:
+Every glide path above lives through the same {glides.n_paths:,} markets, so the differences in the table come only from the allocation. Bonds make the ride smoother, but they also make the engine smaller: moving to bonds too early or too much often costs more in the median than it saves in the bad scenarios. Play with the schedule and check both the median and the worst 5%.
+""")
+
+st.markdown("""
+### 🧭 Spending rules: adapting in retirement
+
+Up to now the retirement spending is fixed, come rain or shine. Nobody does that: after a bad year in the markets people tighten the belt, and after a few good ones they treat themselves. Here are a few classic rules, all starting from the same retirement spending as above:
+
+- **Fixed spending:** the same amount every year, as in the simulations above.
+- **Constant %:** every year you spend the same share of your current wealth as in the first year. You can never run out, but your spending follows the market up and down.
+- **Floor and ceiling:** the constant %, but never below the floor or above the ceiling (in % of the first year's spending).
+- **Guardrails** (Guyton-Klinger): you keep your spending, unless your withdrawal rate drifts too far from the first year's. Then you cut (or raise) it by a fixed step.
+
+All rules are replayed on the same simulated markets, so the table shows the price of each rule: how much you can spend, how much your spending jumps around, and how often the money runs out.
+""")
+
+with st.form("Spending rules"):
+
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        spending_floor = st.number_input("Floor (%)", min_value=0, max_value=100, value=80, step=5)
+
+    with col2:
+        spending_ceiling = st.number_input("Ceiling (%)", min_value=100, max_value=500, value=150, step=10)
+
+    with col3:
+        guardrail = st.number_input("Guardrails (± % of the first rate)", min_value=0, max_value=100, value=20, step=5)
+
+    with col4:
+        guardrail_adjustment = st.number_input("Spending cut or raise (%)", min_value=0, max_value=50, value=10, step=1)
+
+    st.form_submit_button("Compare spending rules")
+
+policies = (
+    WithdrawalPolicy("Fixed spending"),
+    WithdrawalPolicy("Constant %", follow_wealth=True),
+    WithdrawalPolicy("Floor and ceiling", follow_wealth=True, floor=spending_floor, ceiling=spending_ceiling),
+    WithdrawalPolicy("Guardrails", guardrail=guardrail, adjustment=guardrail_adjustment),
+)
+
+# yearly steps: the rules decide once a year
+@st.cache_data(max_entries=16)
+def run_withdrawal_policies(life_cycle, market, policies, n_paths):
+    return withdrawal_comparison(life_cycle, market, policies, n_paths)
+
+if years_retirement == 0:
+    st.info("Set some years of retirement in the settings above to compare the spending rules.")
+else:
+    withdrawals = run_withdrawal_policies(life_cycle, market, policies, n_sims_delta)
+
+    fig = go.Figure()
+    for policy, (lower, median, upper) in zip(policies, withdrawals.spending_bands):
+        fig.add_trace(go.Scatter(x=time_axis(years_retirement, start=years_work+1), y=median, mode='lines', name=policy.name))
+    fig.update_layout(
+        title="Median yearly spending in retirement",
+        xaxis_title="Years",
+        yaxis_title="Yearly spending (real value)",
+        template="simple_white",
+        hovermode="x unified"
+    )
+    st.plotly_chart(fig, use_container_width=True)
+
+    statistics = withdrawals.statistics
+    policy_table = pd.DataFrame({"Spending rule": [policy.name for policy in policies]} | statistics)
+    policy_table["Ruin probability ± (%)"] = 100*z_score()*probability_standard_error(statistics["Ruin probability (%)"]/100, withdrawals.n_paths)
+    st.dataframe(policy_table.style.format({
+        "Median yearly spending": "{:,.0f}",
+        "Worst 5% leanest year": "{:,.0f}",
+        "Spending volatility (%)": "{:.1f}",
+        "Ruin probability (%)": "{:.1f}",
+        "Median final wealth": "{:,.0f}",
+        "Ruin probability ± (%)": "{:.1f}",
+    }), hide_index=True)
+
+    st.markdown("""
+###  Takeaway message:
+A rule that listens to the markets trades certainty of *income* for certainty of *wealth*. Fixed spending is smooth until the money is gone; the constant % never runs out but can make for some lean years. Floors, ceilings and guardrails sit in between: a bit of flexibility removes most of the ruin scenarios, and the leanest year tells you how much belt-tightening that flexibility asks for.
+""")
+
 
 st.markdown("""### 📝  Final thoughts
 - Volatility is not the enemy or scary. It is the engine of growth.
@@ -1,5 +1,176 @@
 import streamlit as st
+import pandas as pd
+import numpy as np
+import plotly.express as px
+import plotly.graph_objects as go
+
+from utils import amortization_schedule, simulate_rent_vs_buy
+
+st.title("Rent or Buy? 🏡")
+st.subheader("Owning a home is not automatically an investment")
 
 st.markdown("""
-Coming soon... Write me at andrea.idini (at) gmail.com if you want to thank me for this project or if you have an idea!
-""")
\ No newline at end of file
+"Renting is throwing money away" is one of the most repeated sentences in personal finance. But buying also throws money away: mortgage interest, maintenance, property taxes, and the fees you pay when you buy and sell. Meanwhile, the renter can invest the down payment and whatever they save every month.
+
+Who ends up richer depends on the numbers, and on luck: both house prices and markets are volatile. Below we simulate thousands of possible futures and compare the **home equity** of the owner with the **portfolio** of a renter who invests the difference.
+
+## 1. The mortgage 🏦
+
+First, how much does the mortgage cost? The table shows the monthly payment for different rates and durations. Longer mortgages have lower payments, but you pay interest for many more years.
+""")
+
+col1, col2, col3 = st.columns(3)
+
+with col1:
+    house_price = st.number_input("House price (currency)", value=400000.0, step=10000.0)
+
+with col2:
+    down_payment = st.slider("Down payment (%)", min_value=0, max_value=100, value=20)
+
+with col3:
+    mortgage_rate = st.number_input("Mortgage rate (%)", value=4.0, step=0.1)
+
+principal = house_price * (1 - down_payment/100)
+
+# every combination of rate and term in one go
+grid_rates = np.array([mortgage_rate - 1, mortgage_rate, mortgage_rate + 1])
+grid_terms = np.array([15, 20, 25, 30])
+rates, terms = np.meshgrid(grid_rates, grid_terms, indexing="ij")
+payments, balance = amortization_schedule(principal, rates.ravel(), terms.ravel(), 12*grid_terms.max())
+total_interest = (payments.sum(axis=1) - principal).reshape(rates.shape)
+
+payment_table = pd.DataFrame(
+    payments[:, 1].reshape(rates.shape),
+    index=[f"{r:.1f}%" for r in grid_rates],
+    columns=[f"{t} years" for t in grid_terms],
+)
+st.markdown("**Monthly payment** (rows: mortgage rate, columns: duration)")
+st.dataframe(payment_table.style.format("{:,.0f}"))
+
+# middle row is the chosen rate, first and last columns are 15 and 30 years
+st.markdown(f"""With a {mortgage_rate:.1f}% rate over 30 years you will pay {total_interest[1, -1]:,.0f} in interest on a loan of {principal:,.0f}.
+Over 15 years, only {total_interest[1, 0]:,.0f}.""")
+
+st.divider()
+
+st.markdown("""
+## 2. The race: equity vs portfolio 🏁
+
+The owner pays the down payment, the buying costs, the mortgage and the upkeep of the house. The renter pays the rent and invests everything else: the down payment on day one, and every month the difference between what the owner spends and the rent.
+
+The simulation runs 10,000 scenarios for house prices and market returns. When does the owner catch up?
+""")
+
+with st.form("Rent vs Buy simulation"):
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        rent = st.number_input("Monthly rent (currency)", value=1500.0, step=50.0)
+    with col2:
+        mortgage_term = st.slider("Mortgage duration (Years)", min_value=5, max_value=40, value=30)
+    with col3:
+        years = st.slider("Time Horizon (Years)", min_value=1, max_value=50, value=30)
+
+    with st.expander("⚙️ Settings"):
+        opt_col1, opt_col2 = st.columns(2)
+        with opt_col1:
+            house_growth = st.number_input("House price growth (%)", value=3.0, step=0.1)
+        with opt_col2:
+            house_volatility = st.number_input("House price volatility (%/month)", value=1.5, step=0.1)
+
+        opt_col1, opt_col2 = st.columns(2)
+        with opt_col1:
+            investment_rate = st.number_input("Investment Return (%)", value=7.0, step=0.1)
+        with opt_col2:
+            investment_volatility = st.number_input("Investment Volatility (%/month)", value=2.0, step=0.1)
+
+        opt_col1, opt_col2 = st.columns(2)
+        with opt_col1:
+            rent_growth = st.number_input("Rent growth (%)", value=2.0, step=0.1)
+        with opt_col2:
+            owner_costs = st.number_input("Maintenance and taxes (% of value per year)", value=1.0, step=0.1)
+
+        opt_col1, opt_col2 = st.columns(2)
+        with opt_col1:
+            buy_costs = st.number_input("Buying costs (%)", value=3.0, step=0.5)
+        with opt_col2:
+            sell_costs = st.number_input("Selling costs (%)", value=5.0, step=0.5)
+
+    calculate_btn = st.form_submit_button("Run Simulation")
+
+@st.cache_data
+def run_rent_vs_buy(n_paths, years, house_price, down_payment, mortgage_rate, mortgage_term, rent, rent_growth,
+                    house_growth, house_volatility, investment_rate, investment_volatility,
+                    owner_costs, buy_costs, sell_costs, seed=0):
+
+    result = simulate_rent_vs_buy(n_paths, years, house_price, down_payment, mortgage_rate, mortgage_term,
+                                  rent, rent_growth, house_growth, house_volatility,
+                                  investment_rate, investment_volatility,
+                                  owner_costs, buy_costs, sell_costs, rng=np.random.default_rng(seed))
+    # only keep the bands, the full paths are too heavy to cache
+    return {
+        "breakeven_year": result["breakeven_year"],
+        "equity": np.percentile(result["equity"], [5, 50, 95], axis=0),
+        "portfolio": np.percentile(result["portfolio"], [5, 50, 95], axis=0),
+        "owner_wins": np.mean(result["equity"][:, -1] > result["portfolio"][:, -1]),
+    }
+
+n_paths = 10000
+result = run_rent_vs_buy(n_paths, years, house_price, down_payment, mortgage_rate, mortgage_term, rent, rent_growth,
+                         house_growth, house_volatility, investment_rate, investment_volatility,
+                         owner_costs, buy_costs, sell_costs)
+
+breakeven_year = result["breakeven_year"]
+never = np.isnan(breakeven_year)
+
+col1, col2 = st.columns(2)
+with col1:
+    st.metric(label=f"Owner is richer after {years} years", value=f"{100*result['owner_wins']:.0f}% of scenarios")
+with col2:
+    if never.all():
+        st.metric(label="Median break-even", value="never")
+    else:
+        st.metric(label="Median break-even", value=f"{np.nanmedian(breakeven_year):.1f} years")
+
+if never.any():
+    st.warning(f"⚠️ In {100*never.mean():.0f}% of scenarios the owner never catches up with the renter within {years} years.")
+
+if not never.all():
+    fig = px.histogram(
+        breakeven_year[~never],
+        nbins=40,
+        title="When does the owner catch up with the renter?",
+        labels={'value': 'Break-even year', 'count': 'Frequency'},
+        opacity=0.8,
+        template="simple_white"
+    )
+    fig.update_traces(marker_line_width=1.5, marker_line_color="white")
+    fig.update_layout(showlegend=False)
+    st.plotly_chart(fig, use_container_width=True)
+
+year_range = np.arange(12*years+1)/12
+
+fig = go.Figure()
+for name, bands, color in [("Home equity", result["equity"], "255, 75, 75"), ("Renter portfolio", result["portfolio"], "0, 100, 255")]:
+    fig.add_trace(go.Scatter(x=year_range, y=bands[2], mode='lines', line=dict(width=0), showlegend=False, name=f'{name} upper 90%'))
+    fig.add_trace(go.Scatter(x=year_range, y=bands[0], mode='lines', line=dict(width=0), fill='tonexty',
+                             fillcolor=f'rgba({color}, 0.2)', showlegend=False, name=f'{name} lower 90%'))
+    fig.add_trace(go.Scatter(x=year_range, y=bands[1], mode='lines', line=dict(color=f'rgb({color})', width=3), name=name))
+
+fig.update_layout(
+    title="Median wealth of owner and renter (bands: 90% of scenarios)",
+    xaxis_title="Years",
+    yaxis_title="Wealth",
+    template="simple_white",
+    hovermode="x unified",
+    legend=dict(yanchor="top", y=0.99, xanchor="left", x=0.01, bgcolor="rgba(255, 255, 255, 0.5)")
+)
+st.plotly_chart(fig, use_container_width=True)
+
+st.markdown("""
+###  Takeaway message:
+- Buying has large upfront and exit costs. On short horizons renting almost always wins.
+- The mortgage is leverage: when house prices rise, the owner's equity grows much faster than the house itself. When they fall, the equity can vanish.
+- A renter only wins if they actually invest the difference. Renting and spending the difference is the worst of both worlds.
+""")
+
+st.info("Write me at andrea.idini (at) gmail.com if you want to thank me for this project or if you have an idea!")
@@ -1,49 +1,105 @@
 import streamlit as st
+import pandas as pd
+import numpy as np
+import plotly.graph_objects as go
+
+from utils import generate_paths_batch, compounding_frequency_adjusted, simulate_leverage
+
+st.title("Equity vs Debt 📈")
+st.subheader("Borrowing to invest: the double-edged sword")
 
 st.markdown("""
-Coming soon... Write me at andrea.idini (at) gmail.com if you want to thank me for this project or if you have an idea!
+If the market returns 7% per year and you can borrow at 5%, why not borrow as much as possible and pocket the difference? This is **leverage**: investing with borrowed money so that both gains and losses are multiplied.
+
+The catch is that the bank (or the broker) wants its money back. If your investments fall too much, you get a **margin call**: your position is sold at the worst possible moment to repay the debt, and you can no longer wait for the recovery. Remember from [Risk and Reward](/risk): volatility is only harmless if you can stay in the game.
+
+Below we simulate the same market for every leverage ratio from 1× (no debt) to 3×, and see how often the broker pulls the plug.
 """)
 
-# # 1. INITIALIZE STATE
-# # We need to create the variables in memory if they don't exist yet.
-# if "stocks" not in st.session_state:
-#     st.session_state.stocks = 60
-# if "bonds" not in st.session_state:
-#     st.session_state.bonds = 40
-
-# # 2. DEFINE CALLBACK FUNCTIONS
-# # These run immediately when a slider is moved, BEFORE the page reloads.
-
-# def update_bonds():
-#     # If Stocks changed, Bonds must become the remainder
-#     st.session_state.bonds = 100 - st.session_state.stocks
-
-# def update_stocks():
-#     # If Bonds changed, Stocks must become the remainder
-#     st.session_state.stocks = 100 - st.session_state.bonds
-
-# # 3. CREATE THE SLIDERS
-# col1, col2 = st.columns(2)
-
-# with col1:
-#     # Notice we don't use 'value='. We use 'key='.
-#     # Streamlit automatically binds the slider to st.session_state['stocks']
-#     st.slider(
-#         "Stocks allocation (%)", 
-#         min_value=0, 
-#         max_value=100, 
-#         key="stocks",          # Links to st.session_state.stocks
-#         on_change=update_bonds # Trigger this function when user moves this slider
-#     )
-
-# with col2:
-#     st.slider(
-#         "Bonds allocation (%)", 
-#         min_value=0, 
-#         max_value=100, 
-#         key="bonds",           # Links to st.session_state.bonds
-#         on_change=update_stocks # Trigger this function when user moves this slider
-#     )
-
-# # 4. VERIFICATION
-# st.write(f"**Total:** {st.session_state.stocks + st.session_state.bonds}%")
+with st.form("Leverage simulation"):
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        investment_rate = st.number_input("Investment Return (%)", value=7.0, step=0.1)
+    with col2:
+        investment_volatility = st.number_input("Investment Volatility (%/month)", value=4.5, step=0.1)
+    with col3:
+        borrow_rate = st.number_input("Borrowing cost (%)", value=5.0, step=0.1)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        maintenance = st.slider("Maintenance margin (%)", min_value=5, max_value=50, value=25)
+    with col2:
+        years = st.slider("Time Horizon (Years)", min_value=1, max_value=30, value=10)
+
+    calculate_btn = st.form_submit_button("Run Simulation")
+
+@st.cache_data
+def run_leverage(n_paths, years, volatility, rate, borrow_rate, maintenance, initial_amount, seed=0):
+    prices = generate_paths_batch(n_paths, 12*years+1, volatility, rate, rng=np.random.default_rng(seed))
+    leverage = np.linspace(1, 3, 9)
+    result = simulate_leverage(prices, leverage, borrow_rate, maintenance, start_val=initial_amount)
+    return {
+        "leverage": leverage,
+        "final": result["final"],
+        "margin_call_probability": result["margin_call_probability"],
+        "call_year": np.where(result["margin_call"], result["call_step"]/12, np.nan),
+    }
+
+initial_amount = 1000
+n_paths = 10000
+result = run_leverage(n_paths, years, investment_volatility/100, compounding_frequency_adjusted(investment_rate, 12),
+                      borrow_rate, maintenance, initial_amount)
+
+leverage = result["leverage"]
+final = result["final"]
+
+summary = pd.DataFrame({
+    "Leverage": [f"{l:.2f}×" for l in leverage],
+    "Margin call (%)": 100*result["margin_call_probability"],
+    "Median final value": np.median(final, axis=1),
+    "Worst 5%": np.percentile(final, 5, axis=1),
+    "Best 5%": np.percentile(final, 95, axis=1),
+    "Below initial (%)": 100*np.mean(final < initial_amount, axis=1),
+})
+
+st.markdown(f"### What happens to {initial_amount} after {years} years?")
+st.dataframe(summary.style.format({
+    "Margin call (%)": "{:.1f}",
+    "Median final value": "{:,.0f}",
+    "Worst 5%": "{:,.0f}",
+    "Best 5%": "{:,.0f}",
+    "Below initial (%)": "{:.1f}",
+}), hide_index=True)
+
+fig = go.Figure()
+fig.add_trace(go.Scatter(x=leverage, y=summary["Best 5%"], mode='lines', line=dict(width=0), showlegend=False, name='Best 5%'))
+fig.add_trace(go.Scatter(x=leverage, y=summary["Worst 5%"], mode='lines', line=dict(width=0), fill='tonexty',
+                         fillcolor='rgba(0, 100, 255, 0.2)', showlegend=False, name='Worst 5%'))
+fig.add_trace(go.Scatter(x=leverage, y=summary["Median final value"], mode='lines+markers',
+                         line=dict(color='rgb(0, 100, 255)', width=3), name='Median final value'))
+fig.add_trace(go.Scatter(x=leverage, y=summary["Margin call (%)"], mode='lines+markers', yaxis="y2",
+                         line=dict(color='#FF4B4B', width=3), name='Margin call probability (%)'))
+
+fig.update_layout(
+    title="Final value and margin calls by leverage",
+    xaxis_title="Leverage",
+    yaxis_title="Final value",
+    yaxis2=dict(title="Margin call probability (%)", overlaying="y", side="right", range=[0, 100]),
+    template="simple_white",
+    hovermode="x unified",
+    legend=dict(yanchor="top", y=0.99, xanchor="left", x=0.01, bgcolor="rgba(255, 255, 255, 0.5)")
+)
+st.plotly_chart(fig, use_container_width=True)
+
+call_year = result["call_year"]
+if np.isnan(call_year[-1]).all():
+    st.success("🎉 Even at 3× leverage no simulation received a margin call.")
+else:
+    st.warning(f"⚠️ At 3× leverage, {100*result['margin_call_probability'][-1]:.0f}% of the simulations are closed by a margin call, half of them within {np.nanmedian(call_year[-1]):.1f} years: the little equity left after repaying the debt sits in cash and misses the recovery.")
+
+st.markdown("""
+###  Takeaway message:
+- A little leverage raises the median outcome, as long as the investment returns more than the borrowing cost.
+- Too much leverage *lowers* the median: volatility drag is multiplied, and margin calls lock in the losses right at the bottom.
+- The worst outcomes get much worse, much faster than the best ones get better. A mortgage is leverage too, which is why the [Rent vs Buy](/rent-buy) question is so sensitive to house prices.
+""")
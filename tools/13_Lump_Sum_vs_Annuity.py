@@ -1,13 +1,144 @@
 import streamlit as st
+import pandas as pd
+import numpy as np
+import plotly.express as px
 
+from utils import compare_lump_sum_annuity
 
-# Maybe first volatility-variance explanation,
-# then drawdown, 
-# then sharpe ratio, 
-# then figure for same sharpe and different volatility. 
- 
-# geometric brownian motion?
+st.title("A lump sum or a pension? 💰")
+st.subheader("Betting on your own life")
 
 st.markdown("""
-Coming soon... Write me at andrea.idini (at) gmail.com if you want to thank me for this project or if you have an idea!
-""")
\ No newline at end of file
+At retirement (or when you win the lottery) you are often offered a choice: take a big **lump sum** today, or a smaller **annuity**, a fixed payment every year for as long as you live.
+
+This is the [Egg or Chicken](/tvm) question again, with a twist: the chicken only comes if you are still alive. The annuity is worth more the longer you live and the less you could earn by investing the lump sum yourself.
+
+Two numbers decide everything:
+- the **discount rate**: what you could earn investing the lump sum,
+- the **horizon**: how many years the payments last, which for a life annuity means how long you live.
+""")
+
+col1, col2, col3 = st.columns(3)
+
+with col1:
+    lump_sum = st.number_input("Lump sum (currency)", value=200000.0, step=10000.0)
+
+with col2:
+    payment = st.number_input("Annuity payment (per year)", value=12000.0, step=500.0)
+
+with col3:
+    age = st.slider("Your age", min_value=40, max_value=90, value=65)
+
+col1, col2 = st.columns(2)
+
+with col1:
+    investment_rate = st.number_input("Investment Return (%)", value=4.0, step=0.1)
+
+with col2:
+    sample_lives = st.checkbox("Simulate 10,000 possible lifespans", value=False)
+
+@st.cache_data
+def run_lump_sum_annuity(lump_sum, payment, age, n_lives, seed=0):
+    rates = np.arange(0, 10.01, 0.25)
+    horizons = np.arange(1, 121-age)
+    result = compare_lump_sum_annuity(lump_sum, payment, age, rates, horizons, n_lives=n_lives, rng=np.random.default_rng(seed))
+    result["rates"] = rates
+    result["horizons"] = horizons
+    return result
+
+result = run_lump_sum_annuity(lump_sum, payment, age, 10000 if sample_lives else 0)
+rates, horizons = result["rates"], result["horizons"]
+rate_index = np.abs(rates - investment_rate).argmin()
+if not rates[0] <= investment_rate <= rates[-1]:
+    st.info(f"ℹ️ The charts below cover returns from {rates[0]:.0f}% to {rates[-1]:.0f}%: your {investment_rate:.2f}% is shown as {rates[rate_index]:.2f}%.")
+
+st.markdown("""
+## 1. How long do you need to live? ⏳
+
+If you take the annuity and die early, the insurance company keeps the rest. The break-even is the number of years of payments that are worth the lump sum, once you account for what the lump sum would have earned in the meantime.
+""")
+
+breakeven_year = result["breakeven_year"][rate_index]
+if np.isnan(breakeven_year):
+    st.warning(f"⚠️ At {rates[rate_index]:.2f}% return the annuity never pays back the lump sum. Investing the lump sum gives you forever more than the annuity.")
+else:
+    life_expectancy = age + result["survival"][1:].sum()
+    st.success(f"🎉 At {rates[rate_index]:.2f}% return the annuity pays back the lump sum if you live to **{age + breakeven_year:.0f}**. Your life expectancy is {life_expectancy:.0f}.")
+
+breakeven_ages = pd.DataFrame({
+    "Investment Return (%)": rates,
+    "Break-even age": age + result["breakeven_year"],
+})
+st.line_chart(breakeven_ages, x="Investment Return (%)", y="Break-even age", x_label="Investment Return (%)", y_label="Age at which the annuity wins")
+
+st.markdown("""
+## 2. Every rate, every horizon 🗺️
+
+Below is the value of the annuity minus the lump sum, for every discount rate and every payout horizon, weighted by the probability of being alive to collect each payment. Green means the annuity is better.
+""")
+
+difference = result["value"] - lump_sum
+limit = np.abs(difference).max()
+fig = px.imshow(
+    difference,
+    x=age + horizons,
+    y=rates,
+    origin="lower",
+    aspect="auto",
+    color_continuous_scale="RdYlGn",
+    zmin=-limit,
+    zmax=limit,
+    labels={'x': 'Payments stop at age', 'y': 'Discount rate (%)', 'color': 'Annuity - lump sum'},
+    template="simple_white",
+)
+st.plotly_chart(fig, use_container_width=True)
+
+breakeven_rate = result["breakeven_rate"]
+# break-even after 20 years of payments (or the longest horizon left at this age)
+breakeven_rate_20 = breakeven_rate[min(19, len(breakeven_rate)-1)]
+if np.isnan(breakeven_rate_20):
+    breakeven_20_text = "not exist: the lump sum would win at any return"
+elif np.isinf(breakeven_rate_20):
+    breakeven_20_text = "still be above 50%"
+else:
+    breakeven_20_text = f"drop to {breakeven_rate_20:.2f}%"
+if np.isnan(breakeven_rate[-1]):
+    st.write("Even if you live to the end of the life table, the annuity is worth less than the lump sum.")
+elif np.isinf(breakeven_rate[-1]):
+    st.write("Accounting for the chances of being alive, the annuity is worth more than the lump sum for any investment return up to 50%: the lump sum is far too small for these payments.")
+else:
+    st.write(f"""Accounting for the chances of being alive, the annuity is worth the lump sum for any investment return below **{breakeven_rate[-1]:.2f}%**.
+If the payments stopped after 20 years, the break-even return would {breakeven_20_text}.""")
+    if not rates[0] <= breakeven_rate[-1] <= rates[-1]:
+        st.warning(f"⚠️ This break-even return is outside the {rates[0]:.0f}-{rates[-1]:.0f}% range of the map above: along its right edge the map never changes color.")
+
+if sample_lives:
+    st.markdown("""
+## 3. Rolling the dice 🎲
+
+Life expectancy is only an average. Here are 10,000 possible lives drawn from the life table, each valued at your investment return.
+""")
+    difference_lives = result["value_lives"][rate_index] - lump_sum
+    st.metric(label="Annuity is the better deal in", value=f"{100*np.mean(difference_lives > 0):.0f}% of lives")
+
+    fig = px.histogram(
+        difference_lives,
+        nbins=40,
+        title="Annuity minus lump sum, over possible lifespans",
+        labels={'value': 'Annuity - lump sum', 'count': 'Frequency'},
+        opacity=0.8,
+        template="simple_white"
+    )
+    fig.update_traces(marker_line_width=1.5, marker_line_color="white")
+    fig.update_layout(showlegend=False)
+    fig.add_vline(x=0, line_width=4, line_dash="solid", line_color="red")
+    st.plotly_chart(fig, use_container_width=True)
+
+st.markdown("""
+###  Takeaway message:
+- An annuity is insurance against living too long, not an investment. You pay for it by dying early.
+- The higher the return you can get on your own, the longer you need to live for the annuity to be worth it.
+- The lump sum is flexible and can be left to your heirs, the annuity cannot run out. Which one you need depends on your health, your family and your discipline.
+
+**Disclaimer:** the bundled life table is a smooth illustrative table, not the official one of your country. Real annuities are often indexed to inflation and taxed differently from lump sums.
+""")
@@ -1,5 +1,119 @@
+import time
+
 import streamlit as st
+import numpy as np
+import plotly.graph_objects as go
+
+from utils import DISTRIBUTIONS, init_running_stats, running_variance, sample_clt_batch
+from chart_data import chart_frame
+
+st.title("Probability Theory 🎲")
+st.subheader("Why averages are so well behaved")
+
+st.markdown("""
+Every Monte Carlo simulation in this sandbox relies on two theorems that are as close to magic as mathematics gets.
+
+1. **The law of large numbers:** the average of many draws gets closer and closer to the true mean.
+2. **The central limit theorem:** the average of many draws is normally distributed, *whatever* the distribution of a single draw. Coin flips, dice, skewed lognormal returns: average enough of them and you get a bell curve.
+
+This is why a diversified portfolio, or a long investment horizon, behaves so much more predictably than a single stock in a single year.
+
+Pick a distribution and press **Draw**. Samples are generated in batches and only the running statistics are kept, so you can let it run for millions of draws.
+""")
+
+col1, col2, col3 = st.columns(3)
+
+with col1:
+    distribution = st.selectbox("Distribution", list(DISTRIBUTIONS.keys()), index=2)
+
+with col2:
+    sample_size = st.slider("Draws per average", min_value=1, max_value=100, value=10)
+
+with col3:
+    seed = st.number_input("Seed", value=42, step=1)
+
+_, true_mean, true_std = DISTRIBUTIONS[distribution]
+
+# 1. INITIALIZE STATE
+# The random generator lives in the session: the same seed replays the same animation
+def reset_sampler():
+    st.session_state.rng = np.random.default_rng(seed)
+    st.session_state.draws_stats = init_running_stats(true_mean - 4*true_std, true_mean + 4*true_std)
+    spread = 4*true_std/np.sqrt(sample_size)
+    st.session_state.means_stats = init_running_stats(true_mean - spread, true_mean + spread)
+    st.session_state.running_means = []
+    st.session_state.sampler_key = (distribution, sample_size, seed)
+
+if st.session_state.get("sampler_key") != (distribution, sample_size, seed):
+    reset_sampler()
+
+col1, col2, col3 = st.columns(3)
+with col1:
+    draw_btn = st.button("Draw")
+with col2:
+    n_batch = st.select_slider("Averages per frame", options=[10, 100, 1000, 10000, 100000], value=1000)
+with col3:
+    if st.button("Reset"):
+        reset_sampler()
+
+chart_placeholder = st.empty()
+metrics_placeholder = st.empty()
+lln_placeholder = st.empty()
+
+def draw_frame():
+    draws_stats = st.session_state.draws_stats
+    means_stats = st.session_state.means_stats
+
+    edges = means_stats["edges"]
+    centers = (edges[1:] + edges[:-1]) / 2
+    width = edges[1] - edges[0]
+    fig = go.Figure()
+    fig.add_trace(go.Bar(x=centers, y=means_stats["counts"], width=width, name="Averages drawn",
+                         marker=dict(color='rgba(0, 100, 255, 0.6)', line=dict(color="white", width=1))))
+    if means_stats["count"] > 0:
+        sigma = true_std/np.sqrt(sample_size)
+        x = np.linspace(edges[0], edges[-1], 200)
+        normal = means_stats["count"] * width * np.exp(-0.5*((x - true_mean)/sigma)**2) / (sigma*np.sqrt(2*np.pi))
+        fig.add_trace(go.Scatter(x=x, y=normal, mode='lines', line=dict(color='#FF4B4B', width=3), name="Central limit theorem"))
+    fig.update_layout(
+        title=f"Distribution of the average of {sample_size} draws",
+        xaxis_title="Average",
+        yaxis_title="Frequency",
+        template="simple_white",
+        legend=dict(yanchor="top", y=0.99, xanchor="right", x=0.99, bgcolor="rgba(255, 255, 255, 0.5)")
+    )
+    chart_placeholder.plotly_chart(fig, use_container_width=True)
+
+    with metrics_placeholder.container():
+        col1, col2, col3 = st.columns(3)
+        col1.metric(label="Draws so far", value=f"{draws_stats['count']:,}")
+        col2.metric(label="Running mean", value=f"{draws_stats['mean']:.4f}", delta=f"{draws_stats['mean'] - true_mean:+.4f} from true mean", delta_color="off")
+        running_std = np.sqrt(running_variance(draws_stats))
+        col3.metric(label="Running std", value="-" if np.isnan(running_std) else f"{running_std:.4f}", delta=f"true std {true_std:.4f}", delta_color="off")
+
+    if st.session_state.running_means:
+        # the first frame needs no DataFrame, pandas is loaded with the first draws
+        lln = chart_frame({
+            "Draws": np.cumsum([n for n, _ in st.session_state.running_means]),
+            "Running mean": [m for _, m in st.session_state.running_means],
+            "True mean": true_mean,
+        })
+        lln_placeholder.line_chart(lln, x="Draws", y=["Running mean", "True mean"], x_label="Number of draws", y_label="Mean", color=["#0064FF", "#FF4B4B"])
+
+if draw_btn:
+    for frame in range(30):
+        start = time.perf_counter()
+        sample_clt_batch(distribution, sample_size, n_batch, st.session_state.draws_stats, st.session_state.means_stats, rng=st.session_state.rng)
+        st.session_state.running_means.append((n_batch*sample_size, st.session_state.draws_stats["mean"]))
+        draw_frame()
+        # about 10 frames per second, whatever the batch size
+        time.sleep(max(0., 0.1 - (time.perf_counter() - start)))
+else:
+    draw_frame()
 
 st.markdown("""
-Coming soon... Write me at andrea.idini (at) gmail.com if you want to thank me for this project or if you have an idea!
-""")
\ No newline at end of file
+###  Takeaway message:
+- However skewed a single draw is, the average of many draws looks like a bell curve, and its width shrinks like one over the square root of the number of draws.
+- With 4 times more draws, the average is only 2 times more precise. Certainty is expensive.
+- The same math is why [Risk and Reward](/risk) picks its number of simulations from the precision you ask for: a quick pilot run measures how wide each statistic is, and going from Rough (± 5%) to Precise (± 1%) takes about 25 times more simulations. The tails stay the hardest part to pin down.
+""")
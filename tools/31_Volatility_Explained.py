@@ -1,13 +1,239 @@
+import os
+import tempfile
+
 import streamlit as st
+import pandas as pd
+import numpy as np
+import plotly.express as px
+import plotly.graph_objects as go
+
+from utils import compounding_frequency_adjusted, analyze_paths_chunked, histogram_percentiles, generate_paths_memmap, stream_path_statistics
+
+st.title("Volatility Explained 📊")
+st.subheader("The math behind the wiggles")
+
+st.markdown("""
+In [Risk and Reward](/risk) we saw that volatility is the price of admission for high returns. Here we look under the hood: what does volatility actually do to your money?
+
+We simulate 100,000 market paths with a **geometric Brownian motion**: every month the price moves by the expected return plus a random shock whose size is the volatility. Then we measure, on every single path, how painful the ride was.
+""")
+
+with st.form("Volatility analytics"):
+    col1, col2, col3 = st.columns(3)
+
+    with col1:
+        investment_rate = st.number_input("Investment Return (%)", value=7.0, step=0.1)
+
+    with col2:
+        investment_volatility = st.slider("Investment Volatility (%/month)", min_value=0.5, max_value=15.0, value=4.0)
+
+    with col3:
+        years = st.slider("Time Horizon (Years)", min_value=2, max_value=30, value=10)
+
+    st.form_submit_button("Run Simulation")
+
+risk_free_rate = 3.
+
+@st.cache_data
+def run_volatility_analytics(n_paths, years, volatility, rate, risk_free_rate, seed=0):
+    # 10,000 paths at a time in float32: only the per-path statistics and one histogram per month stay in memory
+    edges = np.linspace(0, 4*volatility*np.sqrt(12), 401)
+    stats = analyze_paths_chunked(n_paths, 12*years+1, volatility, rate, edges, window=12, steps_per_year=12,
+                                  risk_free=risk_free_rate, rng=np.random.default_rng(seed))
+    stats["rolling_volatility"] = histogram_percentiles(stats.pop("rolling_volatility_counts"), edges, [5, 50, 95])
+    return stats
+
+n_paths = 100000
+stats = run_volatility_analytics(n_paths, years, investment_volatility/100, compounding_frequency_adjusted(investment_rate, 12), risk_free_rate)
+
+st.markdown("""
+## 1. Volatility drag 🐌
+
+Lose 50% and gain 50%, and you are not back to even: you are at 75%. The *average* monthly return is what the market promises, but the *compounded* (geometric) return is what you get. The difference grows with the square of the volatility:
+
+$$
+\\text{geometric mean} \\approx \\text{arithmetic mean} - \\frac{\\sigma^2}{2}
+$$
+""")
+
+drag = 12*100*stats["volatility_drag"]
+col1, col2 = st.columns(2)
+with col1:
+    st.metric(label="Median volatility drag", value=f"{np.median(drag):.2f}% per year")
+with col2:
+    st.metric(label="Rule of thumb σ²/2", value=f"{12*100*(investment_volatility/100)**2/2:.2f}% per year")
+
+fig = px.histogram(
+    drag,
+    nbins=50,
+    title="Volatility drag over all simulations (% per year)",
+    labels={'value': 'Arithmetic minus geometric return (% per year)', 'count': 'Frequency'},
+    opacity=0.8,
+    template="simple_white"
+)
+fig.update_traces(marker_line_width=1.5, marker_line_color="white")
+fig.update_layout(showlegend=False)
+st.plotly_chart(fig, use_container_width=True)
+
+st.divider()
+
+st.markdown("""
+## 2. Drawdown: the pain you feel 📉
+
+The **drawdown** is how far the price is below its previous peak. The **maximum drawdown** is the worst fall an investor had to sit through, and the **time under water** is how long they waited before seeing a new high.
+These are the numbers that make people panic and sell.
+""")
+
+max_drawdown = 100*stats["max_drawdown"]
+longest_underwater = stats["longest_underwater"]
+
+col1, col2, col3 = st.columns(3)
+with col1:
+    st.metric(label="Median max drawdown", value=f"{np.median(max_drawdown):.0f}%")
+with col2:
+    st.metric(label="Worst 5% max drawdown", value=f"{np.percentile(max_drawdown, 95):.0f}%")
+with col3:
+    st.metric(label="Median longest time under water", value=f"{np.median(longest_underwater):.1f} years")
+
+col1, col2 = st.columns(2)
+with col1:
+    fig = px.histogram(
+        max_drawdown,
+        nbins=40,
+        title="Maximum drawdown (%)",
+        labels={'value': 'Maximum drawdown (%)', 'count': 'Frequency'},
+        opacity=0.8,
+        template="simple_white"
+    )
+    fig.update_traces(marker_line_width=1.5, marker_line_color="white")
+    fig.update_layout(showlegend=False)
+    st.plotly_chart(fig, use_container_width=True)
+
+with col2:
+    fig = px.histogram(
+        longest_underwater,
+        nbins=40,
+        title="Longest time under water (years)",
+        labels={'value': 'Years below the previous peak', 'count': 'Frequency'},
+        opacity=0.8,
+        template="simple_white"
+    )
+    fig.update_traces(marker_line_width=1.5, marker_line_color="white")
+    fig.update_layout(showlegend=False)
+    st.plotly_chart(fig, use_container_width=True)
+
+st.divider()
+
+st.markdown("""
+## 3. Realized volatility is volatile too 🎢
+
+The volatility you set is the *true* one. What you observe looking at the last 12 months of prices, the **realized volatility**, jumps around it. Calm years are not proof that the market became safe.
+""")
+
+bands = 100*stats["rolling_volatility"]
+year_range = np.arange(12, 12*years+1)/12
+
+fig = go.Figure()
+fig.add_trace(go.Scatter(x=year_range, y=bands[2], mode='lines', line=dict(width=0), showlegend=False, name='Upper 90%'))
+fig.add_trace(go.Scatter(x=year_range, y=bands[0], mode='lines', line=dict(width=0), fill='tonexty',
+                         fillcolor='rgba(0, 100, 255, 0.2)', showlegend=False, name='Lower 90%'))
+fig.add_trace(go.Scatter(x=year_range, y=bands[1], mode='lines', line=dict(color='rgb(0, 100, 255)', width=3), name='Median 12-month realized volatility'))
+fig.add_hline(y=investment_volatility*np.sqrt(12), line_width=3, line_dash="dash", line_color="#FF4B4B")
+fig.update_layout(
+    title="12-month realized volatility (% per year)",
+    xaxis_title="Years",
+    yaxis_title="Realized volatility (%)",
+    template="simple_white",
+    hovermode="x unified",
+    legend=dict(yanchor="top", y=0.99, xanchor="left", x=0.01, bgcolor="rgba(255, 255, 255, 0.5)")
+)
+st.plotly_chart(fig, use_container_width=True)
+
+st.divider()
+
+st.markdown(f"""
+## 4. The Sharpe ratio ⚖️
+
+The **Sharpe ratio** is the extra return you get over a risk-free investment ({risk_free_rate:.0f}% here), divided by the volatility you endure. It measures how well you are paid for the risk.
+Even the Sharpe ratio measured over {years} years is uncertain: the same market can look brilliant or mediocre depending on luck.
+""")
+
+fig = px.histogram(
+    stats["sharpe"],
+    nbins=50,
+    title=f"Sharpe ratio measured over {years} years",
+    labels={'value': 'Sharpe ratio', 'count': 'Frequency'},
+    opacity=0.8,
+    template="simple_white"
+)
+fig.update_traces(marker_line_width=1.5, marker_line_color="white")
+fig.update_layout(showlegend=False)
+st.plotly_chart(fig, use_container_width=True)
+
+st.divider()
+
+st.markdown("""
+## 5. Under the microscope: daily prices 🔬
+
+Monthly prices hide a lot. A market can fall 15% and recover within the same month, and a monthly chart will never show it. Here we simulate every trading day (252 per year) with the same yearly return and volatility, and look for the worst fall *inside a single month*.
+
+Daily paths are heavy: 100,000 paths over 50 years are more than a billion prices. They are generated a few years at a time, stored on disk and analysed chunk by chunk, so only the statistics stay in memory. To keep the server usable for everybody, a simulation is limited to 250 million prices (1 GB on disk, about 20 seconds): fewer simulations allow longer horizons.
+""")
+
+with st.form("Daily simulation"):
+    col1, col2 = st.columns(2)
+    with col1:
+        daily_paths = st.select_slider("Number of simulations", options=[1000, 10000, 100000], value=1000)
+    with col2:
+        daily_years = st.slider("Time Horizon (Years)", min_value=1, max_value=50, value=10, key="daily_years")
+    daily_btn = st.form_submit_button("Run daily simulation")
+
+# prices of one daily simulation, stored as float32
+MAX_DAILY_PRICES = 250_000_000
+n_daily_prices = daily_paths * (252*daily_years + 1)
+
+@st.cache_data
+def run_daily_analytics(n_paths, years, volatility, rate, seed=0):
+    # about 2 million prices in memory at a time, in whole months
+    chunk_steps = 21 * max(1, 2_000_000 // (21*n_paths))
+    with tempfile.TemporaryDirectory() as scratch:
+        prices = generate_paths_memmap(os.path.join(scratch, "daily_paths.npy"), n_paths, 252*years+1, volatility, rate,
+                                       chunk_steps=chunk_steps, rng=np.random.default_rng(seed))
+        stats = stream_path_statistics(prices, steps_per_year=252, window_steps=21, chunk_steps=chunk_steps)
+        del prices
+    return stats
+
+if daily_btn and n_daily_prices > MAX_DAILY_PRICES:
+    st.error(f"⚠️ {daily_paths:,} simulations over {daily_years} years are {n_daily_prices/1e6:,.0f} million prices ({4*n_daily_prices/1e9:.1f} GB on disk), "
+             f"more than the {MAX_DAILY_PRICES/1e6:,.0f} million allowed. Choose fewer simulations or a shorter horizon.")
+elif daily_btn:
+    # monthly volatility spread over 21 trading days
+    with st.spinner(f"Simulating {n_daily_prices/1e6:,.0f} million daily prices ({4*n_daily_prices/1e9:.2f} GB on disk)..."):
+        daily_stats = run_daily_analytics(daily_paths, daily_years, investment_volatility/100/np.sqrt(21), compounding_frequency_adjusted(investment_rate, 252))
 
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric(label="Median worst fall within a month", value=f"{100*np.median(daily_stats['max_window_drawdown']):.0f}%")
+    with col2:
+        st.metric(label="Median max drawdown (daily prices)", value=f"{100*np.median(daily_stats['max_drawdown']):.0f}%")
 
-# Maybe first volatility-variance explanation,
-# then drawdown, 
-# then sharpe ratio, 
-# then figure for same sharpe and different volatility. 
- 
-# geometric brownian motion?
+    fig = px.histogram(
+        pd.DataFrame({
+            "Within a month": 100*daily_stats["max_window_drawdown"],
+            "Whole period": 100*daily_stats["max_drawdown"],
+        }),
+        nbins=50,
+        barmode="overlay",
+        title=f"Worst drawdown over {daily_paths:,} daily simulations (%)",
+        labels={'value': 'Drawdown (%)', 'count': 'Frequency', 'variable': ''},
+        opacity=0.6,
+        template="simple_white"
+    )
+    st.plotly_chart(fig, use_container_width=True)
 
 st.markdown("""
-Coming soon... Write me at andrea.idini (at) gmail.com if you want to thank me for this project or if you have an idea!
-""")
\ No newline at end of file
+###  Takeaway message:
+- Volatility costs return by itself: the drag grows with the square of the volatility.
+- Drawdowns of 20-30% and years under water are normal even in a market with a good average return.
+- Short-term measures of risk and performance are noisy. Judge strategies on long periods, and never on a single good year.
+""")
@@ -1,12 +1,21 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from statistics import NormalDist
+
 import numpy as np
 
-# rate in %, years as int or array-like
+LIFE_TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "life_table.csv")
+
+# rate in %, years as int or array-like. All arguments broadcast, e.g. rate[:, None] against time[None, :] gives a grid
 def calculate_compound_interest(principal, rate, time):
     # Ensure inputs are numpy arrays so math operations broadcast
     time = np.asarray(time)
+    rate = np.asarray(rate)
     return principal * ((1 + rate/100) ** time)
 
 def calculate_breakeven_year(target_amount, principal, rate):
+    rate = np.asarray(rate)
     return np.log(target_amount / principal) / np.log(1 + rate/100)
 
 # rate in %, time as int
@@ -29,6 +38,12 @@ def generate_deltas(n_steps, volatility, expected_return, seed=False):
     deltaprice = expected_return/100. + volatility * rand
     return deltaprice
 
+# Batched version of generate_deltas: returns of shape (n_paths, n_steps-1)
+def generate_deltas_batch(n_paths, n_steps, volatility, expected_return, rng=None):
+    if rng is None: rng = np.random.default_rng()
+    rand = rng.standard_normal(size=(n_paths, n_steps-1))
+    return np.asarray(expected_return)/100. + np.asarray(volatility) * rand
+
 # Simulate Geometric Brownian Motion paths
 # https://quant.stackexchange.com/questions/4589/how-to-simulate-stock-prices-with-a-geometric-brownian-motion
 def generate_paths(n_steps, volatility, expected_return, start_val=1, seed=False):
@@ -43,6 +58,1183 @@ def generate_paths(n_steps, volatility, expected_return, start_val=1, seed=False
 
     return prices*start_val
 
+# Batched version of generate_paths: one row per path, shape (n_paths, n_steps).
+# volatility and expected_return can be scalars or arrays broadcasting against (n_paths, 1)
+def generate_paths_batch(n_paths, n_steps, volatility, expected_return, start_val=1, rng=None):
+    if rng is None: rng = np.random.default_rng()
+    rand = rng.standard_normal(size=(n_paths, n_steps-1))
+    deltaprice = np.asarray(expected_return)/100. + np.asarray(volatility) * rand
+
+    prices = np.empty((n_paths, n_steps))
+    prices[:, 0] = 1
+    np.cumprod(1 + deltaprice, axis=1, out=prices[:, 1:])
+
+    return prices*start_val
+
+# Inflation and nominal returns simulated together, for real (purchasing power) outcomes.
+# The yearly inflation rate follows an AR(1) around inflation_mean:
+# pi_t - mean = persistence * (pi_{t-1} - mean) + shock_t, with shocks of inflation_volatility % per year,
+# and the return shocks are correlated with the inflation shocks. Rates, yearly_volatility and inflation_volatility
+# in % per year (unlike the monthly volatility of generate_paths), persistence per year;
+# steps_per_year sets the step size (the AR(1) keeps the same yearly behaviour).
+# Returns per-step nominal returns, inflation and real returns (in %), and the price level, shape (n_paths, n_steps).
+def generate_inflation_paths(n_paths, n_steps, expected_return, yearly_volatility, inflation_mean, inflation_volatility,
+                             persistence=0.7, correlation=0., start_inflation=None, steps_per_year=1, rng=None):
+    if rng is None: rng = np.random.default_rng()
+    if start_inflation is None: start_inflation = inflation_mean
+    step_persistence = persistence**(1/steps_per_year)
+    # shocks per step giving the same long-run spread of the yearly rate
+    if persistence < 1:
+        step_shock = inflation_volatility * np.sqrt((1 - step_persistence**2) / (1 - persistence**2))
+    else:
+        step_shock = inflation_volatility / np.sqrt(steps_per_year)
+
+    inflation_shocks = rng.standard_normal(size=(n_paths, n_steps))
+    return_shocks = correlation * inflation_shocks + np.sqrt(1 - correlation**2) * rng.standard_normal(size=(n_paths, n_steps))
+
+    # direct recursion: a few dozen steps, and no division by persistence**t (zero or underflowing for small persistence)
+    deviation = np.empty((n_paths, n_steps))
+    previous = np.full(n_paths, start_inflation - inflation_mean, dtype=float)
+    for t in range(n_steps):
+        previous = step_persistence * previous + step_shock * inflation_shocks[:, t]
+        deviation[:, t] = previous
+    # yearly rate converted to the step
+    inflation = compounding_frequency_adjusted(inflation_mean + deviation, steps_per_year)/100
+
+    nominal = compounding_frequency_adjusted(expected_return, steps_per_year)/100 + yearly_volatility/100/np.sqrt(steps_per_year) * return_shocks
+    real = (1 + nominal) / (1 + inflation) - 1
+    price_level = np.cumprod(1 + inflation, axis=1)
+    return {
+        "nominal": 100*nominal,
+        "inflation": 100*inflation,
+        "real": 100*real,
+        "price_level": price_level,
+    }
+
+# Multi-resolution paths: annual points for all paths, monthly (or daily) detail only where it is displayed.
+# Prices are log-normal with the same monthly mean return and volatility as generate_paths,
+# so a year is a single normal draw of the log-price: 12 times fewer random numbers for year-N statistics.
+def generate_coarse_paths(n_paths, n_years, volatility, expected_return, start_val=1, rng=None):
+    if rng is None: rng = np.random.default_rng()
+    drift = np.log(1 + expected_return/100.) - volatility**2/2
+    log_returns = 12*drift + np.sqrt(12)*volatility * rng.standard_normal(size=(n_paths, n_years))
+
+    log_prices = np.zeros((n_paths, n_years+1))
+    np.cumsum(log_returns, axis=1, out=log_prices[:, 1:])
+    return start_val*np.exp(log_prices)
+
+# Fill in steps_per_year points per year between the annual points of some coarse paths with a Brownian bridge,
+# for the years [year_start, year_end]. The refined path goes exactly through the annual points.
+# Returns shape (len(path_index), (year_end-year_start)*steps_per_year + 1).
+def refine_paths(coarse, volatility, path_index=slice(None), year_start=0, year_end=None, steps_per_year=12, rng=None):
+    if rng is None: rng = np.random.default_rng()
+    if year_end is None: year_end = coarse.shape[-1] - 1
+    knots = np.log(coarse[path_index, year_start:year_end+1])
+    n_paths, n_years = knots.shape[0], knots.shape[1] - 1
+
+    # volatility is per month, as everywhere else
+    step_volatility = volatility * np.sqrt(12/steps_per_year)
+    fraction = np.arange(1, steps_per_year+1) / steps_per_year
+    walk = np.cumsum(step_volatility * rng.standard_normal(size=(n_paths, n_years, steps_per_year)), axis=-1)
+    # a random walk pinned to zero at both ends of each year, added on the straight line between the knots
+    bridge = walk - fraction * walk[..., -1:]
+    start, end = knots[:, :-1, None], knots[:, 1:, None]
+    fine = start + (end - start) * fraction + bridge
+
+    refined = np.empty((n_paths, n_years*steps_per_year + 1))
+    refined[:, 0] = knots[:, 0]
+    refined[:, 1:] = fine.reshape(n_paths, -1)
+    return np.exp(refined)
+
+# High-resolution paths (e.g. daily) that do not fit in memory: generated chunk_steps at a time
+# and stored as float32 in a memory-mapped .npy file. The file is time-major, so that each chunk of steps
+# is contiguous on disk; the returned array is its transposed view, with the usual (n_paths, n_steps) shape.
+# Same model as generate_paths_batch; the last price of each chunk seeds the next one.
+def generate_paths_memmap(filename, n_paths, n_steps, volatility, expected_return, start_val=1, chunk_steps=2520, rng=None, dtype=np.float32):
+    if rng is None: rng = np.random.default_rng()
+    prices = np.lib.format.open_memmap(filename, mode="w+", dtype=dtype, shape=(n_steps, n_paths)).T
+    prices[:, 0] = start_val
+
+    last = np.full(n_paths, float(start_val))
+    for start in range(1, n_steps, chunk_steps):
+        stop = min(start + chunk_steps, n_steps)
+        deltaprice = expected_return/100. + volatility * rng.standard_normal(size=(n_paths, stop - start))
+        chunk = last[:, None] * np.cumprod(1 + deltaprice, axis=1)
+        prices[:, start:stop] = chunk
+        last = chunk[:, -1]
+
+    prices.base.flush()
+    return prices
+
+# Statistics of a (n_paths, n_steps) price matrix read chunk_steps at a time, e.g. a memory map from
+# generate_paths_memmap: only per-path running state is kept (peak, drawdown, time under water).
+# window_steps splits the time axis in windows (e.g. 21 trading days for a month): "max_window_drawdown"
+# is the worst peak-to-trough fall inside a single window. "yearly" holds the value at the end of each year.
+def stream_path_statistics(prices, steps_per_year=252, window_steps=21, chunk_steps=2520):
+    n_paths, n_steps = prices.shape
+    # chunks made of whole windows, so the windows never straddle two chunks
+    chunk_steps = max(window_steps, chunk_steps - chunk_steps % window_steps)
+
+    peak = np.full(n_paths, -np.inf)
+    max_drawdown = np.zeros(n_paths)
+    max_window_drawdown = np.zeros(n_paths)
+    last_peak = np.zeros(n_paths, dtype=np.int64)
+    longest_underwater = np.zeros(n_paths, dtype=np.int64)
+    yearly = np.empty((n_paths, (n_steps-1)//steps_per_year + 1), dtype=prices.dtype)
+
+    for start in range(0, n_steps, chunk_steps):
+        # time-major chunk: the running maxima below then sweep whole rows of paths at once
+        chunk = np.ascontiguousarray(prices[:, start:start+chunk_steps].T, dtype=float)
+        steps = np.arange(start, start + chunk.shape[0])[:, None]
+
+        running_peak = np.maximum(np.maximum.accumulate(chunk, axis=0), peak)
+        max_drawdown = np.maximum(max_drawdown, (1 - chunk/running_peak).max(axis=0))
+
+        at_peak = chunk >= running_peak
+        chunk_last_peak = np.maximum.accumulate(np.where(at_peak, steps, last_peak), axis=0)
+        longest_underwater = np.maximum(longest_underwater, (steps - chunk_last_peak).max(axis=0))
+        last_peak = chunk_last_peak[-1]
+        peak = running_peak[-1]
+
+        # drawdown inside each window, restarting the peak at the window start
+        n_windows = -(-chunk.shape[0] // window_steps)
+        padded = np.pad(chunk, ((0, n_windows*window_steps - chunk.shape[0]), (0, 0)), mode="edge")
+        windows = padded.reshape(n_windows, window_steps, n_paths)
+        window_drawdown = (1 - windows/np.maximum.accumulate(windows, axis=1)).max(axis=(0, 1))
+        max_window_drawdown = np.maximum(max_window_drawdown, window_drawdown)
+
+        year_steps = steps[steps % steps_per_year == 0]
+        yearly[:, year_steps // steps_per_year] = chunk[year_steps - start].T
+
+    return {
+        "max_drawdown": max_drawdown,
+        "max_window_drawdown": max_window_drawdown,
+        "longest_underwater": longest_underwater / steps_per_year,
+        "yearly": yearly,
+        "final": np.asarray(prices[:, -1], dtype=float),
+    }
+
+# Value of a portfolio receiving cash flow c_t at the start of each step and then growing by growth_t:
+# W_t = (W_{t-1} + c_t) * growth_t, solved for all paths at once with cumulative products.
+# growth (non-zero) and contributions broadcast to (..., n_steps), start_val to (...). Returns shape (..., n_steps+1)
+def invest_cashflows(growth, contributions, start_val=0):
+    growth = np.asarray(growth, dtype=float)
+    start_val = np.asarray(start_val, dtype=float)[..., None]
+    cumgrowth = np.cumprod(growth, axis=-1)
+    # value of each flow expressed in "time zero" units (in place: with many paths these are the big arrays)
+    discounted = np.asarray(contributions) * growth
+    discounted /= cumgrowth
+    np.cumsum(discounted, axis=-1, out=discounted)
+    wealth = np.empty(np.broadcast_shapes(discounted.shape, start_val.shape)[:-1] + (discounted.shape[-1]+1,))
+    wealth[..., 0] = start_val[..., 0]
+    np.add(start_val, discounted, out=wealth[..., 1:])
+    wealth[..., 1:] *= cumgrowth
+    return wealth
+
+# --- RISK METRICS ---
+
+# Risk table of the values reached by n_paths simulations, shape (n_paths,) or (n_paths, n_horizons).
+# A single np.partition per horizon, on all the tail sizes at once, gives every VaR and CVaR
+# (the k smallest values sit before index k, so their sum is a cumulative sum) plus min and max.
+# VaR/CVaR are losses with respect to `initial` at each confidence level, target is the value regarded
+# as "good enough" for Sortino, Omega and the probability of falling short (default: initial).
+def calculate_risk_metrics(values, initial, confidence=(0.9, 0.95, 0.99), target=None):
+    values = np.asarray(values, dtype=float)
+    confidence = np.atleast_1d(np.asarray(confidence, dtype=float))
+    target = initial if target is None else target
+    n_paths = values.shape[0]
+
+    # number of paths in each tail (rounded first: (1 - 0.9) * 100 is 9.999...)
+    tail = np.maximum(1, np.floor(np.round((1 - confidence) * n_paths, 6)).astype(int))
+    kth = np.unique(np.concatenate([[0, n_paths-1], tail - 1]))
+    ordered = np.partition(values, kth, axis=0)
+    tail_sum = np.cumsum(ordered[:tail.max()], axis=0)
+
+    # one pass for the shortfall below the target, the upside follows from the mean
+    downside = np.maximum(target - values, 0)
+    expected_downside = downside.mean(axis=0)
+    downside_deviation = np.sqrt(np.square(downside, out=downside).mean(axis=0))
+    expected_excess = values.mean(axis=0) - target
+    upside = expected_excess + expected_downside
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sortino = np.where(downside_deviation > 0, expected_excess / downside_deviation, np.inf)
+        omega = np.where(expected_downside > 0, upside / expected_downside, np.inf)
+
+    return {
+        "confidence": confidence,
+        "VaR": initial - ordered[tail - 1],
+        "CVaR": initial - tail_sum[tail - 1] / tail.reshape((-1,) + (1,)*(values.ndim-1)),
+        "Sortino": sortino,
+        "Omega": omega,
+        "Loss probability": (values < initial).mean(axis=0),
+        "Shortfall probability": (values < target).mean(axis=0),
+        "Min": ordered[0],
+        "Max": ordered[n_paths-1],
+    }
+
+# --- MONTE CARLO PRECISION ---
+
+# z-score of a two-sided confidence level, e.g. 1.96 for 95%
+def z_score(confidence=0.95):
+    return NormalDist().inv_cdf((1 + confidence)/2)
+
+# Standard error of probabilities estimated as the fraction of n_paths simulations
+def probability_standard_error(probability, n_paths):
+    probability = np.asarray(probability, dtype=float)
+    return np.sqrt(probability*(1 - probability)/n_paths)
+
+# Distribution-free confidence interval of the percentiles q (in %) of values along axis 0.
+# The number of simulations below the true percentile is binomial(n_paths, q), so the bounds are
+# the order statistics z standard deviations around q*n_paths. The estimate interpolates like np.percentile.
+# All the order statistics come from one np.partition. Returns estimate, lower, upper, shape (len(q), ...).
+def percentile_confidence_interval(values, q, confidence=0.95):
+    values = np.asarray(values, dtype=float)
+    q = np.atleast_1d(np.asarray(q, dtype=float))/100
+    n_paths = values.shape[0]
+
+    position = q*(n_paths - 1)
+    below = np.floor(position).astype(int)
+    above = np.minimum(below + 1, n_paths - 1)
+    spread = z_score(confidence)*np.sqrt(n_paths*q*(1 - q))
+    lower = np.clip(np.floor(position - spread), 0, n_paths - 1).astype(int)
+    upper = np.clip(np.ceil(position + spread), 0, n_paths - 1).astype(int)
+
+    ordered = np.partition(values, np.unique(np.concatenate([below, above, lower, upper])), axis=0)
+    weight = (position - below).reshape((-1,) + (1,)*(values.ndim-1))
+    estimate = ordered[below] + weight*(ordered[above] - ordered[below])
+    return estimate, ordered[lower], ordered[upper]
+
+# Smallest number of paths (rounded up to a multiple of step) for which every confidence half-width
+# measured on a pilot run of n_pilot paths falls below its tolerance: half-widths shrink like 1/sqrt(n_paths).
+def required_paths(half_width, tolerance, n_pilot, min_paths=100, max_paths=100000, step=100):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.nan_to_num(np.asarray(half_width)/np.asarray(tolerance), nan=0., posinf=np.inf)
+    n_paths = n_pilot*np.max(ratio, initial=0.)**2
+    if not np.isfinite(n_paths):
+        return max_paths
+    return int(np.clip(np.ceil(n_paths/step)*step, min_paths, max_paths))
+
+# --- LIFE CYCLE ---
+
+# Wealth of the yearly life-cycle table: wealth[0] = 0, wealth[i] = (wealth[i-1] + contribution[i-1]) * growth[i-1].
+# Same length as the table, as in the pages (the last row's flows fall after the end of the horizon).
+# Rows can be stacked on leading axes, e.g. one row per fee variant.
+def life_cycle_wealth(contributions, growth):
+    return invest_cashflows(np.asarray(growth)[..., :-1], np.asarray(contributions)[..., :-1])
+
+# First row where two tables differ, None if they are identical (0 if the shapes differ)
+def first_changed_row(old, new):
+    if old is None or np.shape(old) != np.shape(new): return 0
+    changed = np.flatnonzero((np.asarray(old) != np.asarray(new)).reshape(-1, np.shape(new)[-1]).any(axis=0))
+    return int(changed[0]) if len(changed) else None
+
+# life_cycle_wealth that only recomputes what an edit can affect. `cache` is a dict kept between reruns
+# (e.g. in st.session_state): the rows before the first edited one are reused, the suffix is recomputed
+# in one vectorized step starting from the cached wealth at that row.
+def incremental_life_cycle_wealth(cache, contributions, growth):
+    contributions = np.asarray(contributions, dtype=float)
+    growth = np.asarray(growth, dtype=float)
+    table = np.stack(np.broadcast_arrays(contributions, growth))
+
+    first = first_changed_row(cache.get("table"), table)
+    if first is None:
+        return cache["wealth"]
+    if first == 0:
+        wealth = life_cycle_wealth(contributions, growth)
+    else:
+        # wealth[first] only depends on the rows before the edit
+        wealth = cache["wealth"].copy()
+        wealth[..., first+1:] = invest_cashflows(growth[..., first:-1], contributions[..., first:-1], start_val=wealth[..., first])[..., 1:]
+
+    cache["table"] = table
+    cache["wealth"] = wealth
+    return wealth
+
+# Dollar-cost averaging, lump sum and value averaging on the same return paths, in one call.
+# deltas: (n_paths, n_steps) returns per step, contributions: (n_steps,) cash flows of the life cycle,
+# positive during the first n_accumulation steps. The alternatives change only how that money goes in:
+# - lump sum: the present value (at expected_return % per step) of the savings is invested on day one,
+# - value averaging: each step tops up (or takes out) whatever keeps the portfolio on the expected DCA path.
+# Withdrawals after the accumulation are the same for all. Wealth has shape (n_strategies, n_paths, n_steps+1)
+# and "gain" is the final wealth minus the net money put in, so strategies investing different amounts compare fairly.
+CONTRIBUTION_STRATEGIES = ["Dollar-cost averaging", "Lump sum", "Value averaging"]
+
+def compare_contribution_strategies(deltas, contributions, n_accumulation, expected_return):
+    growth = 1 + np.asarray(deltas, dtype=float)
+    contributions = np.asarray(contributions, dtype=float)
+    n_paths, n_steps = growth.shape
+    expected_growth = 1 + expected_return/100
+
+    lump = contributions.copy()
+    lump[:n_accumulation] = 0
+    lump[0] = np.sum(contributions[:n_accumulation] / expected_growth**np.arange(n_accumulation))
+
+    # target: wealth right after each contribution if returns were exactly as expected
+    expected_path = invest_cashflows(np.full(n_steps, expected_growth), contributions)
+    target = expected_path[:n_accumulation] + contributions[:n_accumulation]
+    value_averaging = np.broadcast_to(contributions, (n_paths, n_steps)).copy()
+    # before topping up, the portfolio is last step's target grown by the actual return
+    before = np.zeros((n_paths, n_accumulation))
+    before[:, 1:] = target[:-1] * growth[:, :n_accumulation-1]
+    value_averaging[:, :n_accumulation] = target - before
+
+    flows = np.stack(np.broadcast_arrays(contributions, lump, value_averaging))
+    wealth = invest_cashflows(growth, flows)
+    gain = wealth[..., -1] - flows.sum(axis=-1)
+    return {
+        "wealth": wealth,
+        "gain": gain,
+        "win_rate": (gain > gain[0]).mean(axis=-1),
+    }
+
+# What if the return of year k were -shock% instead? For every k at once.
+# The recursion is linear in the flows, so a crash at k only rescales the money invested at k:
+# wealth_t(k) = wealth_t + ((1 - shock)/growth_k - 1) * (wealth_k + contribution_k) * G_t/G_k for t > k,
+# with G the cumulative growth. contributions and growth are the flows of each step, shape (..., n_steps),
+# leading axes are kept (e.g. a sweep of life-cycle parameters).
+# Returns the wealth for every crash year, shape (..., n_steps, n_steps+1), with the final value and ruin.
+def crash_timing_sweep(contributions, growth, shock):
+    growth = np.asarray(growth, dtype=float)
+    contributions = np.asarray(contributions, dtype=float)
+    wealth = invest_cashflows(growth, contributions)
+    n_steps = wealth.shape[-1] - 1
+
+    cumgrowth = np.ones(wealth.shape)
+    cumgrowth[..., 1:] = np.cumprod(np.broadcast_to(growth, wealth[..., 1:].shape), axis=-1)
+
+    exposed = wealth[..., :-1] + contributions
+    factor = (1 - shock/100) / growth - 1
+    # scale[k, t] = G_t / G_k, only after the crash
+    scale = cumgrowth[..., None, :] / cumgrowth[..., :-1, None]
+    after = np.arange(n_steps+1) > np.arange(n_steps)[:, None]
+    crashed = wealth[..., None, :] + np.where(after, (factor * exposed)[..., None] * scale, 0.)
+
+    ruined = crashed < 0
+    ruin_step = np.where(ruined.any(axis=-1), np.argmax(ruined, axis=-1), -1)
+    return {
+        "wealth": crashed,
+        "final": crashed[..., -1],
+        "ruined": ruin_step >= 0,
+        "ruin_step": ruin_step,
+    }
+
+# --- GLIDE PATHS ---
+
+# Returns of several correlated assets on the same steps, shape (n_paths, n_steps-1, n_assets).
+# volatilities per step and expected_returns in % per step, one per asset (as in generate_deltas_batch).
+# correlation is a matrix, or a scalar for the same correlation between every pair.
+def generate_asset_deltas(n_paths, n_steps, volatilities, expected_returns, correlation=0., rng=None):
+    if rng is None: rng = np.random.default_rng()
+    volatilities = np.asarray(volatilities, dtype=float)
+    correlation = np.asarray(correlation, dtype=float)
+    if correlation.ndim == 0:
+        correlation = np.full((len(volatilities), len(volatilities)), correlation)
+        np.fill_diagonal(correlation, 1.)
+    rand = rng.standard_normal(size=(n_paths, n_steps-1, len(volatilities))) @ np.linalg.cholesky(correlation).T
+    return np.asarray(expected_returns)/100. + volatilities * rand
+
+# Yearly stock share (%) going from start in the first year to end at retirement, then flat.
+# Linear: a little less every year. Step: the share drops every step_years years and holds in between.
+def linear_glide_path(start, end, years_work, years_retirement):
+    shares = np.full(years_work + years_retirement, float(end))
+    shares[:years_work] = start + (end - start) * np.arange(years_work) / years_work
+    return shares
+
+def step_glide_path(start, end, years_work, years_retirement, step_years=10):
+    shares = np.full(years_work + years_retirement, float(end))
+    n_drops = -(-years_work // step_years)
+    shares[:years_work] = start + (end - start) * (np.arange(years_work) // step_years) / n_drops
+    return shares
+
+# Yearly stock share from a table of (year, share) rows, e.g. edited by hand: each share holds from its year
+# until the next row, the first one also before it
+def table_glide_path(table_years, table_shares, n_years):
+    order = np.argsort(table_years)
+    row = np.searchsorted(np.asarray(table_years, dtype=float)[order], np.arange(n_years), side="right") - 1
+    return np.asarray(table_shares, dtype=float)[order][np.maximum(row, 0)]
+
+# (steps x assets) weight matrix of a schedule: the yearly stock share (%) spread over the steps of the year,
+# the rest in bonds. Leading axes of the shares (e.g. one row per glide path) are kept: shape (..., n_steps, 2)
+def glide_path_weights(stock_shares, steps_per_year=12):
+    stocks = np.repeat(np.clip(np.asarray(stock_shares, dtype=float)/100, 0, 1), steps_per_year, axis=-1)
+    return np.stack([stocks, 1 - stocks], axis=-1)
+
+# Return of the rebalanced portfolio at every step, for every path and every schedule at once:
+# asset_deltas (n_paths, n_steps, n_assets) times weights (..., n_steps, n_assets), summed over the assets.
+# The broadcast multiply is done by einsum, without the (..., n_paths, n_steps, n_assets) temporary.
+# Returns shape (..., n_paths, n_steps)
+def blend_returns(asset_deltas, weights):
+    return np.einsum("...ta,pta->...pt", weights, asset_deltas)
+
+# --- REBALANCING ---
+
+# Portfolio that drifts with the markets and is brought back to its target weights on a calendar (every
+# `period` steps, 0 = never) or when a weight drifts more than `band` percentage points away from its target
+# (inf = never), whichever comes first. Every rebalance pays the transaction fees of Fees keep you poor on each
+# trade: fee_rate % of the money moved plus fee_fixed, taken from the portfolio.
+# asset_deltas (n_paths, n_steps, n_assets), period and band broadcast against (n_strategies, 1):
+# a whole sweep of calendars and bands runs in one loop over time.
+# Returns the value (..., n_paths, n_steps+1), and per path the fees paid, the number of rebalances and the
+# average drift from the target (percentage points).
+def simulate_rebalancing(asset_deltas, target, period=0, band=np.inf, fee_rate=0., fee_fixed=0., start_val=1.):
+    asset_deltas = np.asarray(asset_deltas, dtype=float)
+    target = np.asarray(target, dtype=float)
+    period, band = (np.asarray(x)[..., None] for x in (period, band))
+    shape = np.broadcast_shapes(asset_deltas.shape[:-2], period.shape, band.shape)
+    n_steps = asset_deltas.shape[-2]
+
+    holdings = np.broadcast_to(start_val * target, shape + target.shape).copy()
+    value = np.empty(shape + (n_steps+1,))
+    value[..., 0] = start_val
+    fees = np.zeros(shape)
+    rebalances = np.zeros(shape)
+    drift = np.zeros(shape)
+
+    for t in range(n_steps):
+        holdings *= 1 + asset_deltas[..., t, :]
+        total = holdings.sum(axis=-1)
+        ideal = target * total[..., None]
+        off = 100*np.abs(holdings - ideal).max(axis=-1) / np.maximum(np.abs(total), np.finfo(float).tiny)
+        drift += off
+        rebalance = ((period > 0) & ((t + 1) % np.maximum(period, 1) == 0)) | (off > band)
+
+        moved = np.abs(holdings - ideal)
+        cost = np.where(rebalance, moved.sum(axis=-1) * fee_rate/100 + (moved > 0).sum(axis=-1) * fee_fixed, 0.)
+        total = total - cost
+        holdings = np.where(rebalance[..., None], target * total[..., None], holdings)
+
+        fees += cost
+        rebalances += rebalance
+        value[..., t+1] = total
+
+    return {
+        "value": value,
+        "fees": fees,
+        "rebalances": rebalances,
+        "drift": drift / n_steps,
+    }
+
+# --- WITHDRAWAL POLICIES ---
+
+# Retirement where the yearly spending reacts to the wealth. Every policy starts by spending `spending`,
+# i.e. at the initial rate spending / start_wealth of its path, then each year:
+# - follow_wealth: spend the initial rate of the current wealth (constant %), otherwise keep last year's spending,
+# - guardrails (Guyton-Klinger): if the current rate drifts more than guardrail % above (below) the initial one,
+#   cut (raise) last year's spending by adjustment %,
+# - the result is kept between floor % and ceiling % of the initial spending.
+# The defaults give the fixed spending of the pages. The money is taken at the start of the year, then grows:
+# wealth[t+1] = (wealth[t] - spent[t]) * growth[t]. When the wealth is not enough, what is left is spent (ruin).
+# growth (n_paths, n_years), start_wealth (n_paths,). Policy parameters broadcast against (n_policies, 1),
+# so all policies run on the same paths in one loop over the years.
+def simulate_withdrawals(start_wealth, growth, spending, follow_wealth=False, floor=0., ceiling=np.inf, guardrail=np.inf, adjustment=0.):
+    growth = np.asarray(growth, dtype=float)
+    start_wealth = np.asarray(start_wealth, dtype=float)
+    follow_wealth, floor, ceiling, guardrail, adjustment = (np.asarray(x)[..., None] for x in (follow_wealth, floor, ceiling, guardrail, adjustment))
+    shape = np.broadcast_shapes(growth.shape[:-1], start_wealth.shape, *(np.shape(x) for x in (follow_wealth, floor, ceiling, guardrail, adjustment)))
+    n_years = growth.shape[-1]
+
+    initial_rate = spending / np.maximum(start_wealth, np.finfo(float).tiny)
+    upper = initial_rate * (1 + guardrail/100)
+    lower = initial_rate * (1 - guardrail/100)
+    wealth = np.empty(shape + (n_years+1,))
+    spent = np.empty(shape + (n_years,))
+    wealth[..., 0] = start_wealth
+    planned = np.full(shape, float(spending))
+    ruin_year = np.full(shape, -1)
+
+    for t in range(n_years):
+        current = wealth[..., t]
+        if t > 0:
+            rate = np.divide(planned, current, out=np.full(shape, np.inf), where=current > 0)
+            target = np.where(follow_wealth, initial_rate * current, planned)
+            target = np.where(rate > upper, planned * (1 - adjustment/100), np.where(rate < lower, planned * (1 + adjustment/100), target))
+            planned = np.clip(target, spending*floor/100, spending*ceiling/100)
+        spent[..., t] = np.minimum(planned, np.maximum(current, 0))
+        ruin_year = np.where((ruin_year < 0) & (spent[..., t] < planned), t, ruin_year)
+        wealth[..., t+1] = (current - spent[..., t]) * growth[..., t]
+
+    return {
+        "wealth": wealth,
+        "spending": spent,
+        "ruined": ruin_year >= 0,
+        "ruin_year": ruin_year,
+    }
+
+# Summary of simulate_withdrawals over the paths (axis -1 of the results), e.g. one value per policy:
+# the typical yearly spending, the worst 5% of the leanest year, how much the spending moves from one year
+# to the next (median over paths of the std of the yearly changes, in %), the ruin probability and the final wealth
+def withdrawal_statistics(result):
+    spending = result["spending"]
+    changes = 100*np.divide(np.diff(spending, axis=-1), spending[..., :-1], out=np.zeros(spending[..., 1:].shape), where=spending[..., :-1] > 0)
+    return {
+        "Median yearly spending": np.median(spending.mean(axis=-1), axis=-1),
+        "Worst 5% leanest year": np.percentile(spending.min(axis=-1), 5, axis=-1),
+        "Spending volatility (%)": np.median(changes.std(axis=-1), axis=-1) if changes.shape[-1] else np.zeros(spending.shape[:-2]),
+        "Ruin probability (%)": 100*result["ruined"].mean(axis=-1),
+        "Median final wealth": np.median(result["wealth"][..., -1], axis=-1),
+    }
+
+# --- SCENARIO BATCHES ---
+
+# Inputs of the life cycle of Risk and Reward, with the defaults of the page. Yearly fees in %.
+SCENARIO_DEFAULTS = {
+    "job_savings": 1000.,
+    "years_work": 40,
+    "retirement_spending": 5000.,
+    "years_retirement": 30,
+    "investment_rate": 7.,
+    "investment_volatility": 2.,
+    "yearly_fees": 0.,
+}
+
+# Monthly life cycle (savings while working, spending in retirement) for a batch of scenarios at once:
+# every argument holds one value per scenario, rngs one generator per scenario so that a scenario gets
+# the same markets whatever batch it falls in. Horizons differ: after its own horizon a scenario has no
+# flows and no growth. Yearly fees are taken monthly from the growth.
+# Returns the percentiles of the final wealth, shape (n_scenarios, len(percentiles)), and the probability
+# that the money lasts (wealth never negative), shape (n_scenarios,).
+def simulate_life_cycle_batch(job_savings, years_work, retirement_spending, years_retirement, investment_rate,
+                              investment_volatility, yearly_fees=0., n_paths=1000, rngs=None, percentiles=(5, 50, 95)):
+    job_savings, years_work, retirement_spending, years_retirement, investment_rate, investment_volatility, yearly_fees = \
+        np.broadcast_arrays(*(np.atleast_1d(np.asarray(x, dtype=float))
+                              for x in (job_savings, years_work, retirement_spending, years_retirement,
+                                        investment_rate, investment_volatility, yearly_fees)))
+    n_scenarios = len(job_savings)
+    if rngs is None: rngs = [np.random.default_rng() for _ in range(n_scenarios)]
+
+    months_work = np.round(12*years_work).astype(int)[:, None]
+    months = months_work + np.round(12*years_retirement).astype(int)[:, None]
+    step = np.arange(months.max())
+    contributions = np.where(step < months_work, job_savings[:, None]/12,
+                             np.where(step < months, -retirement_spending[:, None]/12, 0.))
+
+    monthly_rate = compounding_frequency_adjusted(investment_rate, 12)
+    monthly_fees = 1 - (1 - yearly_fees/100)**(1/12)
+    growth = np.ones((n_scenarios, n_paths, len(step)))
+    for i, rng in enumerate(rngs):
+        n_months = months[i, 0]
+        growth[i, :, :n_months] += generate_deltas_batch(n_paths, n_months+1, investment_volatility[i]/100, monthly_rate[i], rng=rng) - monthly_fees[i]
+
+    wealth = invest_cashflows(growth, contributions[:, None, :])
+    return {
+        "percentiles": np.percentile(wealth[..., -1], percentiles, axis=1).T,
+        "success_probability": (wealth.min(axis=-1) >= 0).mean(axis=1),
+    }
+
+# Same life cycles, but all scenarios on the same markets: one draw of shocks shared by every scenario, so that
+# their differences come only from their parameters (e.g. 1% against 0.2% fees). Arguments as above.
+# The whole set is one broadcast over (n_scenarios, n_paths, n_months) and one invest_cashflows call.
+# Returns the wealth, shape (n_scenarios, n_paths, n_months+1): after its own horizon a scenario stays flat.
+def simulate_scenario_set(job_savings, years_work, retirement_spending, years_retirement, investment_rate,
+                          investment_volatility, yearly_fees=0., n_paths=1000, rng=None):
+    job_savings, years_work, retirement_spending, years_retirement, investment_rate, investment_volatility, yearly_fees = \
+        (x[:, None, None] for x in np.broadcast_arrays(*(np.atleast_1d(np.asarray(x, dtype=float))
+                                                         for x in (job_savings, years_work, retirement_spending, years_retirement,
+                                                                   investment_rate, investment_volatility, yearly_fees))))
+    if rng is None: rng = np.random.default_rng()
+
+    months_work = np.round(12*years_work).astype(int)
+    months = months_work + np.round(12*years_retirement).astype(int)
+    step = np.arange(months.max())
+    contributions = np.where(step < months_work, job_savings/12, np.where(step < months, -retirement_spending/12, 0.))
+
+    monthly_fees = 1 - (1 - yearly_fees/100)**(1/12)
+    shocks = rng.standard_normal(size=(n_paths, len(step)))
+    growth = np.where(step < months, 1 + compounding_frequency_adjusted(investment_rate, 12)/100 + investment_volatility/100 * shocks - monthly_fees, 1.)
+    return invest_cashflows(growth, contributions)
+
+# --- FEES AND TAXES ---
+
+FEE_COMPONENTS = ["Yearly fees", "Transaction fees", "Performance fees", "Wealth tax"]
+
+# Portfolio with every cost applied each step from the current state:
+# contribution (net of transaction fees) is added, then the return is earned and yearly fees,
+# performance fees above the benchmark and the wealth tax (when the current wealth is above the threshold) are taken.
+# returns in % per step, shape (..., n_steps): leading axes can be scenarios or Monte Carlo paths.
+# Fee parameters (in %) broadcast against the leading axes, e.g. yearly_fees[:, None] sweeps fee levels.
+# The loop runs over time only. Besides the wealth with and without costs, "lost" gives for each component
+# what its charges would have become had they stayed invested: the components add up to the total gap.
+# start_state (the "state" of an earlier result at some step) continues a simulation from there instead of start_val;
+# history=True also keeps "lost" and "charged" at every step in "state", to be able to continue from any step.
+def simulate_fees(contributions, returns, yearly_fees=0., transaction_fees=0., performance_fees=0., benchmark=0.,
+                  wealth_tax=0., wealth_tax_threshold=np.inf, start_val=0., start_state=None, history=False):
+    returns = np.asarray(returns, dtype=float)
+    shape = np.broadcast_shapes(returns.shape, np.shape(contributions),
+                                *(np.shape(x) + (1,) for x in (yearly_fees, transaction_fees, performance_fees, benchmark, wealth_tax, wealth_tax_threshold)))
+    returns = np.broadcast_to(returns, shape)
+    contributions = np.broadcast_to(np.asarray(contributions, dtype=float), shape)
+    n_steps = shape[-1]
+    fee_rate = np.asarray(yearly_fees)/100
+    trans_rate = np.asarray(transaction_fees)/100
+    perf_rate = np.asarray(performance_fees)/100
+    tax_rate = np.asarray(wealth_tax)/100
+    threshold = np.asarray(wealth_tax_threshold)
+
+    wealth = np.empty(shape[:-1] + (n_steps+1,))
+    gross = np.empty(shape[:-1] + (n_steps+1,))
+    if start_state is None:
+        start_state = {"wealth": start_val, "gross": start_val, "lost": {}, "charged": {}}
+    wealth[..., 0] = start_state["wealth"]
+    gross[..., 0] = start_state["gross"]
+    lost = {name: np.broadcast_to(start_state["lost"].get(name, 0.), shape[:-1]).astype(float) for name in FEE_COMPONENTS}
+    charged = {name: np.broadcast_to(start_state["charged"].get(name, 0.), shape[:-1]).astype(float) for name in FEE_COMPONENTS}
+    if history:
+        lost_history = {name: np.empty(shape[:-1] + (n_steps+1,)) for name in FEE_COMPONENTS}
+        charged_history = {name: np.empty(shape[:-1] + (n_steps+1,)) for name in FEE_COMPONENTS}
+        for name in FEE_COMPONENTS:
+            lost_history[name][..., 0] = lost[name]
+            charged_history[name][..., 0] = charged[name]
+
+    for t in range(n_steps):
+        growth = 1 + returns[..., t]/100
+        contribution = contributions[..., t]
+        current = wealth[..., t]
+
+        # transaction fees on money going in and coming out
+        trans = np.abs(contribution) * trans_rate
+        base = current + contribution - trans
+        invested = np.maximum(base, 0)
+
+        charges = {
+            "Yearly fees": invested * fee_rate,
+            "Transaction fees": trans,
+            "Performance fees": invested * perf_rate * np.maximum(0, returns[..., t] - benchmark)/100,
+            # the threshold is checked every step on the current wealth
+            "Wealth tax": np.where(current > threshold, invested * tax_rate, 0.),
+        }
+        wealth[..., t+1] = base * growth - (charges["Yearly fees"] + charges["Performance fees"] + charges["Wealth tax"])
+        gross[..., t+1] = (gross[..., t] + contribution) * growth
+
+        for name in FEE_COMPONENTS:
+            charged[name] += charges[name]
+        # transaction fees are taken before the growth, the others after it
+        lost["Transaction fees"] = (lost["Transaction fees"] + trans) * growth
+        for name in ("Yearly fees", "Performance fees", "Wealth tax"):
+            lost[name] = lost[name] * growth + charges[name]
+        if history:
+            for name in FEE_COMPONENTS:
+                lost_history[name][..., t+1] = lost[name]
+                charged_history[name][..., t+1] = charged[name]
+
+    result = {
+        "wealth": wealth,
+        "gross": gross,
+        "lost": lost,
+        "charged": charged,
+    }
+    if history:
+        result["lost_history"] = lost_history
+        result["charged_history"] = charged_history
+    return result
+
+# State of a simulate_fees result (run with history=True) at step t, to continue from there
+def fees_state(result, t):
+    return {
+        "wealth": result["wealth"][..., t],
+        "gross": result["gross"][..., t],
+        "lost": {name: values[..., t] for name, values in result["lost_history"].items()},
+        "charged": {name: values[..., t] for name, values in result["charged_history"].items()},
+    }
+
+# simulate_fees of the life-cycle table that only recomputes what an edit can affect, like
+# incremental_life_cycle_wealth: `cache` is kept between reruns, the steps before the first edited row are reused
+# and the rest is simulated from the cached state at that row. Any change of the fees recomputes everything.
+def incremental_simulate_fees(cache, contributions, returns, *fee_parameters):
+    contributions = np.asarray(contributions, dtype=float)
+    returns = np.asarray(returns, dtype=float)
+    table = np.stack(np.broadcast_arrays(contributions, returns))
+
+    first = first_changed_row(cache.get("table"), table) if cache.get("fee_parameters") == fee_parameters else 0
+    if first is None:
+        return cache["result"]
+    if first == 0:
+        result = simulate_fees(contributions, returns, *fee_parameters, history=True)
+    else:
+        old = cache["result"]
+        suffix = simulate_fees(contributions[..., first:], returns[..., first:], *fee_parameters,
+                               start_state=fees_state(old, first), history=True)
+        def splice(before, after):
+            return np.concatenate([before[..., :first], after], axis=-1)
+        result = {
+            "wealth": splice(old["wealth"], suffix["wealth"]),
+            "gross": splice(old["gross"], suffix["gross"]),
+            "lost": suffix["lost"],
+            "charged": suffix["charged"],
+            "lost_history": {name: splice(old["lost_history"][name], suffix["lost_history"][name]) for name in FEE_COMPONENTS},
+            "charged_history": {name: splice(old["charged_history"][name], suffix["charged_history"][name]) for name in FEE_COMPONENTS},
+        }
+
+    cache["table"] = table
+    cache["fee_parameters"] = fee_parameters
+    cache["result"] = result
+    return result
+
+# Investment account where taxes are due when money is taken out. Each step the contribution goes in
+# (contribution_scale times, e.g. 1/(1 - income tax) when saving from pre-tax income), then the account grows.
+# Withdrawals (negative contributions) are the money to spend: enough is sold to pay both them and the tax,
+# tax_rate % of the gain part of the sale (gains_only, a taxable account with the average cost basis of each path)
+# or of the whole sale (a tax-deferred account, taxed as income). Money sold leaves the basis in proportion.
+# growth (n_paths, n_steps); tax_rate, gains_only and contribution_scale broadcast against (n_accounts, 1).
+# Loops over time only, and keeps the wealth every keep_every steps, so 100k paths fit in memory.
+def simulate_taxes(contributions, growth, tax_rate, gains_only=True, contribution_scale=1., start_val=0., keep_every=1):
+    growth = np.asarray(growth, dtype=float)
+    contributions = np.broadcast_to(np.asarray(contributions, dtype=float), growth.shape[-1:])
+    tax_rate, gains_only, contribution_scale = (np.asarray(x)[..., None] for x in (tax_rate, gains_only, contribution_scale))
+    shape = np.broadcast_shapes(growth.shape[:-1], tax_rate.shape, gains_only.shape, contribution_scale.shape)
+    n_steps = growth.shape[-1]
+
+    wealth = np.full(shape, float(start_val))
+    basis = np.full(shape, float(start_val))
+    taxes = np.zeros(shape)
+    kept = np.empty(shape + (n_steps//keep_every + 1,))
+    kept[..., 0] = wealth
+    lowest = wealth.copy()
+
+    for t in range(n_steps):
+        contribution = contributions[t]
+        if contribution >= 0:
+            invested = contribution * contribution_scale
+            wealth = wealth + invested
+            basis = basis + invested
+        else:
+            # share of the account that is taxed when sold
+            gain_share = np.where(gains_only, np.clip(np.divide(wealth - basis, wealth, out=np.zeros(shape), where=wealth > 0), 0, 1), 1.)
+            # nothing left to sell, nothing to tax
+            gain_share = np.where(wealth > 0, gain_share, 0.)
+            sold = -contribution / (1 - tax_rate/100 * gain_share)
+            taxes += sold - (-contribution)
+            basis = basis * np.clip(1 - np.divide(sold, wealth, out=np.ones(shape), where=wealth > 0), 0, 1)
+            wealth = wealth - sold
+        wealth = wealth * growth[..., t]
+        np.minimum(lowest, wealth, out=lowest)
+        if (t + 1) % keep_every == 0:
+            kept[..., (t + 1)//keep_every] = wealth
+
+    # what selling everything at the end would still cost
+    due = np.maximum(np.where(gains_only, wealth - basis, wealth), 0) * tax_rate/100
+    return {
+        "wealth": kept,
+        "final": wealth,
+        "basis": basis,
+        "taxes": taxes,
+        "tax_due": due,
+        "ruined": lowest < 0,
+    }
+
+# --- RENT VS BUY ---
+
+# Monthly mortgage payment, rate in % per year, term in years. Broadcasts over arrays of combinations
+def mortgage_payment(principal, rate, term):
+    principal, rate, term = np.broadcast_arrays(*(np.asarray(x, dtype=float) for x in (principal, rate, term)))
+    r = rate/100/12
+    n = term*12
+    with np.errstate(divide='ignore', invalid='ignore'):
+        payment = np.where(r > 0, principal * r / (1 - (1 + r)**-n), principal / n)
+    return payment
+
+# Amortization schedules for many (principal, rate, term) combinations at once, no loop over months.
+# Returns payment and remaining balance with shape (n_combos, n_months+1); month 0 is the signing date.
+def amortization_schedule(principal, rate, term, n_months):
+    principal, rate, term = np.broadcast_arrays(*(np.atleast_1d(np.asarray(x, dtype=float)) for x in (principal, rate, term)))
+    payment = mortgage_payment(principal, rate, term)[:, None]
+    r = (rate/100/12)[:, None]
+    months = np.arange(n_months+1)
+    growth = (1 + r)**months
+    with np.errstate(divide='ignore', invalid='ignore'):
+        paid = np.where(r > 0, payment * (growth - 1) / r, payment * months)
+    balance = np.clip(principal[:, None] * growth - paid, 0, None)
+    # once the mortgage is paid off there is nothing left to pay
+    active = months <= (term*12)[:, None]
+    balance = np.where(active, balance, 0.)
+    payments = np.where(active & (months > 0), payment, 0.)
+    return payments, balance
+
+# Month in which the owner's equity catches up with the renter's portfolio, for every path.
+# NaN where it never happens within the horizon
+def calculate_breakeven_month(equity, portfolio):
+    ahead = equity >= portfolio
+    first = np.argmax(ahead, axis=-1).astype(float)
+    first[~ahead.any(axis=-1)] = np.nan
+    return first
+
+# Monte Carlo of buying a home with a mortgage versus renting and investing the difference.
+# House price and investment returns are simulated per month with generate_paths_batch.
+# All rates in % per year, volatilities in % per month.
+def simulate_rent_vs_buy(n_paths, years, house_price, down_payment, mortgage_rate, mortgage_term,
+                         rent, rent_growth, house_growth, house_volatility,
+                         investment_rate, investment_volatility,
+                         owner_costs=1.0, buy_costs=3.0, sell_costs=5.0, rng=None):
+    if rng is None: rng = np.random.default_rng()
+    n_months = 12*years
+
+    principal = house_price * (1 - down_payment/100)
+    payments, balance = amortization_schedule(principal, mortgage_rate, mortgage_term, n_months)
+    payments, balance = payments[0], balance[0]
+
+    house = generate_paths_batch(n_paths, n_months+1, house_volatility/100, compounding_frequency_adjusted(house_growth, 12), start_val=house_price, rng=rng)
+    market = generate_paths_batch(n_paths, n_months+1, investment_volatility/100, compounding_frequency_adjusted(investment_rate, 12), rng=rng)
+
+    # what the owner spends every month: mortgage plus maintenance and property taxes on the current value
+    owner_spending = payments[1:] + house[:, :-1] * owner_costs/100/12
+    rent_paid = rent * (1 + compounding_frequency_adjusted(rent_growth, 12)/100)**np.arange(n_months)
+
+    # the renter invests the cash the owner put down and then, every month, whatever the owner spends more
+    upfront = house_price * (down_payment + buy_costs)/100
+    portfolio = invest_cashflows(market[:, 1:] / market[:, :-1], owner_spending - rent_paid, start_val=upfront)
+    equity = house * (1 - sell_costs/100) - balance
+
+    breakeven = calculate_breakeven_month(equity, portfolio) / 12
+    return {
+        "house": house,
+        "equity": equity,
+        "portfolio": portfolio,
+        "payments": payments,
+        "balance": balance,
+        "breakeven_year": breakeven,
+    }
+
+# --- LUMP SUM VS ANNUITY ---
+
+# Yearly probability of dying (qx) by age, from the bundled life table
+def load_life_table(path=LIFE_TABLE_PATH):
+    # columns: age, qx (the header is a comment line)
+    table = np.loadtxt(path, delimiter=",", comments="#")
+    ages, qx = table[:, 0].astype(int), table[:, 1]
+    return ages, qx
+
+# Probability of being alive t years from now, t = 0..n_years, given alive at `age`
+def survival_curve(age, n_years, life_table=None):
+    ages, qx = load_life_table() if life_table is None else life_table
+    # past the end of the table nobody survives
+    q = np.ones(n_years)
+    available = qx[age - ages[0]:][:n_years]
+    q[:len(available)] = available
+    survival = np.ones(n_years+1)
+    survival[1:] = np.cumprod(1 - q)
+    return survival
+
+# Sample ages at death for people alive today at `age`, by inverting the survival curve
+def sample_lifespans(n_samples, age, life_table=None, rng=None):
+    if rng is None: rng = np.random.default_rng()
+    ages, qx = load_life_table() if life_table is None else life_table
+    survival = survival_curve(age, ages[-1] - age + 1, (ages, qx))
+    # death happens in year t when survival[t] < u <= survival[t-1]
+    u = rng.uniform(size=n_samples)
+    years_lived = np.searchsorted(-survival, -u, side="left") - 1
+    return years_lived
+
+# Present value of an annuity paying `payment` at the end of each year, on a grid of discount rates (%)
+# and payout horizons (years). Payments are weighted by the survival probability when given.
+# Returns shape (len(rates), len(horizons)); the cumulative sum over years is shared by all horizons.
+def annuity_present_value(payment, rates, horizons, survival=None):
+    rates = np.atleast_1d(np.asarray(rates, dtype=float))
+    horizons = np.atleast_1d(np.asarray(horizons, dtype=int))
+    years = np.arange(1, horizons.max()+1)
+
+    discounted = payment / calculate_compound_interest(1, rates[:, None], years[None, :])
+    if survival is not None:
+        discounted = discounted * np.asarray(survival)[1:horizons.max()+1]
+    cumulative = np.zeros((len(rates), horizons.max()+1))
+    np.cumsum(discounted, axis=1, out=cumulative[:, 1:])
+    return cumulative[:, horizons]
+
+# Present value of the annuity of each horizon at its own rate, elementwise (rates and horizons broadcast).
+# Certain payments use the closed-form annuity factor; with a survival curve, the discounted survival weights
+# are summed year by year, each horizon stopping at its own length.
+def annuity_present_value_at(payment, rates, horizons, survival=None):
+    rates, horizons = np.broadcast_arrays(np.asarray(rates, dtype=float), np.asarray(horizons, dtype=int))
+    discount = 1 / (1 + rates/100)
+    if survival is None:
+        factor = np.divide(1 - discount**horizons, rates/100, out=horizons.astype(float), where=rates != 0)
+        return payment * factor
+    survival = np.asarray(survival, dtype=float)
+    value = np.zeros(rates.shape)
+    weight = np.ones(rates.shape)
+    for year in range(1, horizons.max(initial=0)+1):
+        weight = weight * discount
+        value += np.where(year <= horizons, survival[year] * weight, 0.)
+    return payment * value
+
+# Discount rate (%) at which the annuity is worth exactly the lump sum, for every horizon at once.
+# The present value decreases with the rate, so all horizons are bisected together.
+# No sign change in [lo, hi]: NaN where the annuity is worth less than the lump sum even at rate lo,
+# inf where it is still worth more at rate hi.
+def annuity_breakeven_rate(lump_sum, payment, horizons, survival=None, lo=-5., hi=50., n_iter=60):
+    horizons = np.atleast_1d(np.asarray(horizons, dtype=int))
+    lo = np.full(len(horizons), lo)
+    hi = np.full(len(horizons), hi)
+    valid = annuity_present_value_at(payment, lo, horizons, survival) >= lump_sum
+    always = annuity_present_value_at(payment, hi, horizons, survival) > lump_sum
+    for _ in range(n_iter):
+        mid = (lo + hi) / 2
+        # each horizon only needs its own rate
+        above = annuity_present_value_at(payment, mid, horizons, survival) > lump_sum
+        lo = np.where(above, mid, lo)
+        hi = np.where(above, hi, mid)
+    return np.where(valid, np.where(always, np.inf, (lo + hi) / 2), np.nan)
+
+# Years of payments needed before the annuity has paid back the lump sum, discounted at each rate.
+# Same meaning as calculate_breakeven_year, extended to a vector of rates. NaN if never within max_years
+def annuity_breakeven_year(lump_sum, payment, rates, max_years=100):
+    horizons = np.arange(max_years+1)
+    value = annuity_present_value(payment, rates, horizons)
+    paid_back = value >= lump_sum
+    years = np.argmax(paid_back, axis=1).astype(float)
+    years[~paid_back.any(axis=1)] = np.nan
+    return years
+
+# Everything the Lump Sum vs Annuity page needs in one call. Payouts stop at the horizon or at death:
+# with n_lives > 0 lifespans are also sampled from the life table and each life is valued at every rate.
+def compare_lump_sum_annuity(lump_sum, payment, age, rates, horizons, n_lives=0, life_table=None, rng=None):
+    if life_table is None: life_table = load_life_table()
+    horizons = np.atleast_1d(np.asarray(horizons, dtype=int))
+    survival = survival_curve(age, horizons.max(), life_table)
+
+    result = {
+        "value": annuity_present_value(payment, rates, horizons, survival),
+        "value_certain": annuity_present_value(payment, rates, horizons),
+        "breakeven_rate": annuity_breakeven_rate(lump_sum, payment, horizons, survival),
+        "breakeven_year": annuity_breakeven_year(lump_sum, payment, rates),
+        "survival": survival,
+    }
+    if n_lives:
+        lifespans = sample_lifespans(n_lives, age, life_table, rng=rng)
+        # a sampled life is just a horizon: one column per life
+        result["lifespans"] = lifespans
+        result["value_lives"] = annuity_present_value(payment, rates, np.minimum(lifespans, horizons.max()))
+    return result
+
+# --- LEVERAGE ---
+
+# Buy-and-hold portfolios bought with borrowed money, for a whole sweep of leverage ratios at once.
+# prices: (n_paths, n_steps) asset paths starting at 1. leverage: array of ratios (1 = no debt).
+# The debt grows with borrow_rate (% per year, charged every step), and the broker sells everything
+# as soon as equity falls below `maintenance` % of the assets. After the call the equity left is kept in cash.
+# Only a (n_leverage, n_paths) state is kept while looping over time (the full equity paths of a sweep
+# are about a gigabyte): returns the final equity and the step of the calls (-1 without a call).
+def simulate_leverage(prices, leverage, borrow_rate, maintenance=25., start_val=1, steps_per_year=12):
+    leverage = np.atleast_1d(np.asarray(leverage, dtype=float))[:, None]
+    n_paths, n_steps = prices.shape
+    debt_growth = 1 + compounding_frequency_adjusted(borrow_rate, steps_per_year)/100
+
+    debt = (leverage - 1) * start_val
+    final = np.zeros((leverage.shape[0], n_paths))
+    call_step = np.full(final.shape, -1)
+    for t in range(n_steps):
+        assets = leverage * start_val * prices[:, t]
+        equity = assets - debt
+        open_position = call_step < 0
+        called = open_position & ((assets <= 0) | (equity < maintenance/100 * assets))
+        call_step[called] = t
+        # the broker cannot take more than what is in the account
+        final[called] = np.maximum(equity[called], 0)
+        final = np.where(call_step < 0, equity, final)
+        debt = debt * debt_growth
+
+    return {
+        "final": final,
+        "margin_call": call_step >= 0,
+        "call_step": call_step,
+        "margin_call_probability": (call_step >= 0).mean(axis=-1),
+    }
+
+# --- PATH ANALYTICS ---
+
+# Drawdown, time under water, realized volatility, volatility drag and Sharpe ratio for every path
+# of a (n_paths, n_steps) price matrix, sharing the returns and running maximum between all of them.
+# window is the number of steps of the rolling volatility, risk_free in % per year.
+# float32 prices keep every intermediate in float32.
+def analyze_paths(prices, window=12, steps_per_year=12, risk_free=0.):
+    prices = np.asarray(prices)
+    if prices.dtype != np.float32: prices = prices.astype(float)
+    steps = np.arange(prices.shape[-1])
+
+    returns = prices[..., 1:] / prices[..., :-1] - 1
+    peak = np.maximum.accumulate(prices, axis=-1)
+    drawdown = 1 - prices / peak
+    max_drawdown = drawdown.max(axis=-1)
+
+    # time under water: length of the current stretch below the previous peak, reset at each new peak
+    underwater = drawdown > 0
+    last_peak = np.maximum.accumulate(np.where(underwater, 0, steps), axis=-1)
+    longest_underwater = (steps - last_peak).max(axis=-1) / steps_per_year
+    fraction_underwater = underwater.mean(axis=-1)
+
+    # rolling realized volatility: each window sum is the difference of two shifted views of a cumulative sum,
+    # so the windows are never copied (std() on a sliding_window_view would allocate n_windows*window values per path)
+    log_returns = np.log1p(returns)
+    def rolling_mean(x):
+        cumulative = np.zeros(x.shape[:-1] + (x.shape[-1]+1,), dtype=x.dtype)
+        np.cumsum(x, axis=-1, out=cumulative[..., 1:])
+        return (cumulative[..., window:] - cumulative[..., :-window]) / window
+    rolling_variance = rolling_mean(log_returns**2) - rolling_mean(log_returns)**2
+    rolling_volatility = np.sqrt(np.clip(rolling_variance, 0, None) * steps_per_year)
+
+    # volatility drag: what the average return promises minus what compounding delivers
+    arithmetic_mean = returns.mean(axis=-1)
+    geometric_mean = np.expm1(log_returns.mean(axis=-1))
+    volatility = returns.std(axis=-1)
+
+    excess_return = arithmetic_mean - compounding_frequency_adjusted(risk_free, steps_per_year)/100
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharpe = np.where(volatility > 0, excess_return / volatility * np.sqrt(steps_per_year), np.nan)
+
+    return {
+        "max_drawdown": max_drawdown,
+        "longest_underwater": longest_underwater,
+        "fraction_underwater": fraction_underwater,
+        "rolling_volatility": rolling_volatility,
+        "arithmetic_mean": arithmetic_mean,
+        "geometric_mean": geometric_mean,
+        "volatility_drag": arithmetic_mean - geometric_mean,
+        "volatility": volatility,
+        "sharpe": sharpe,
+    }
+
+# analyze_paths on n_paths GBM paths (as generate_paths_batch) without ever holding them all: chunk_paths paths
+# are simulated and analysed at a time, in float32. The per-path statistics are kept (one value per path);
+# the rolling volatility is folded into one running histogram per step (bins of volatility_edges, see
+# update_running_histograms), so its percentiles come out of histogram_percentiles at the end.
+def analyze_paths_chunked(n_paths, n_steps, volatility, expected_return, volatility_edges, chunk_paths=10_000,
+                          window=12, steps_per_year=12, risk_free=0., rng=None):
+    if rng is None: rng = np.random.default_rng()
+    per_path = {}
+    histograms = np.zeros((n_steps - window, len(volatility_edges) - 1), dtype=np.int64)
+    final = []
+    for start in range(0, n_paths, chunk_paths):
+        size = min(chunk_paths, n_paths - start)
+        rand = rng.standard_normal(size=(size, n_steps-1), dtype=np.float32)
+        prices = np.empty((size, n_steps), dtype=np.float32)
+        prices[:, 0] = 1
+        np.cumprod(1 + (np.float32(expected_return/100.) + np.float32(volatility) * rand), axis=1, out=prices[:, 1:])
+        del rand
+
+        stats = analyze_paths(prices, window, steps_per_year, risk_free)
+        update_running_histograms(histograms, volatility_edges, stats.pop("rolling_volatility"))
+        for name, values in stats.items():
+            per_path.setdefault(name, []).append(values)
+        final.append(prices[:, -1])
+
+    result = {name: np.concatenate(values) for name, values in per_path.items()}
+    result["rolling_volatility_counts"] = histograms
+    result["final"] = np.concatenate(final)
+    return result
+
+# --- STREAMING SAMPLER ---
+
+# Distributions for the probability page: sampler, true mean and true standard deviation
+DISTRIBUTIONS = {
+    "Normal": (lambda rng, size: rng.standard_normal(size), 0., 1.),
+    "Uniform": (lambda rng, size: rng.uniform(size=size), 0.5, np.sqrt(1/12)),
+    "Exponential": (lambda rng, size: rng.exponential(size=size), 1., 1.),
+    "Coin flip": (lambda rng, size: rng.integers(0, 2, size=size).astype(float), 0.5, 0.5),
+    "Dice": (lambda rng, size: rng.integers(1, 7, size=size).astype(float), 3.5, np.sqrt(35/12)),
+    "Lognormal": (lambda rng, size: rng.lognormal(size=size), np.exp(0.5), np.sqrt((np.e - 1)*np.e)),
+}
+
+# Running statistics with constant memory: count, mean and M2 (Welford), and a histogram on fixed bins.
+# Values outside [lo, hi) are counted in the first and last bins.
+def init_running_stats(lo, hi, n_bins=50):
+    return {
+        "count": 0,
+        "mean": 0.,
+        "m2": 0.,
+        "edges": np.linspace(lo, hi, n_bins+1),
+        "counts": np.zeros(n_bins, dtype=np.int64),
+    }
+
+# Merge a batch into the running statistics (Chan et al. parallel form of Welford's update)
+def update_running_stats(stats, values):
+    values = np.ravel(values)
+    n = len(values)
+    if n == 0: return stats
+    batch_mean = values.mean()
+    batch_m2 = np.square(values - batch_mean).sum()
+
+    total = stats["count"] + n
+    delta = batch_mean - stats["mean"]
+    stats["mean"] += delta * n / total
+    stats["m2"] += batch_m2 + delta**2 * stats["count"] * n / total
+    stats["count"] = total
+
+    # fixed bins: the bin index is arithmetic, bincount is much faster than np.histogram
+    edges = stats["edges"]
+    n_bins = len(edges) - 1
+    index = ((values - edges[0]) * (n_bins / (edges[-1] - edges[0]))).astype(np.int64)
+    np.clip(index, 0, n_bins-1, out=index)
+    stats["counts"] += np.bincount(index, minlength=n_bins)
+    return stats
+
+# One running histogram per column: counts (n_columns, n_bins) += the histogram of values[:, column] on the
+# fixed bins `edges` (values outside are counted in the first and last bins, as in update_running_stats)
+def update_running_histograms(counts, edges, values):
+    n_columns, n_bins = counts.shape
+    index = ((np.asarray(values) - edges[0]) * (n_bins / (edges[-1] - edges[0]))).astype(np.int64)
+    np.clip(index, 0, n_bins-1, out=index)
+    # one bincount for all columns: column c uses the bins [c*n_bins, (c+1)*n_bins)
+    counts += np.bincount((index + n_bins*np.arange(n_columns)).ravel(), minlength=n_columns*n_bins).reshape(n_columns, n_bins)
+    return counts
+
+# Percentiles q (in %) of every column of running histograms, interpolated linearly inside the bins.
+# Shape (len(q), n_columns)
+def histogram_percentiles(counts, edges, q):
+    cumulative = np.cumsum(counts, axis=-1)
+    targets = np.asarray(q, dtype=float)[:, None] / 100 * cumulative[:, -1]
+    percentiles = np.empty((len(targets), len(counts)))
+    for i, target in enumerate(targets):
+        bin_index = np.minimum((cumulative < target[:, None]).sum(axis=-1), counts.shape[-1]-1)
+        below = np.where(bin_index > 0, cumulative[np.arange(len(counts)), bin_index-1], 0)
+        inside = counts[np.arange(len(counts)), bin_index]
+        fraction = np.divide(target - below, inside, out=np.zeros(len(counts)), where=inside > 0)
+        percentiles[i] = edges[bin_index] + fraction * (edges[1] - edges[0])
+    return percentiles
+
+def running_variance(stats):
+    return stats["m2"] / (stats["count"] - 1) if stats["count"] > 1 else np.nan
+
+# Draw n_batch sample means of sample_size draws each and fold them into `means_stats`,
+# while `draws_stats` follows the raw draws (law of large numbers). Nothing is stored but the statistics.
+def sample_clt_batch(distribution, sample_size, n_batch, draws_stats, means_stats, rng=None):
+    if rng is None: rng = np.random.default_rng()
+    sampler = DISTRIBUTIONS[distribution][0]
+    draws = sampler(rng, (n_batch, sample_size))
+    update_running_stats(draws_stats, draws)
+    update_running_stats(means_stats, draws.mean(axis=1))
+    return draws_stats, means_stats
+
+# --- BACKGROUND PRECOMPUTE ---
+
+# A single worker shared by every session: precomputing must never slow down the page being drawn
+PREFETCH_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+
+def _run_unless_cancelled(cancel, func, args):
+    if not cancel.is_set():
+        func(*args)
+
+# Calls func(*args) in the background for every tuple of arguments, in order, e.g. on the values
+# next to a slider so that a cached func is warm when the slider moves there.
+# Pass the event returned by the previous call: it is set, and the jobs not started yet are dropped.
+def prefetch(func, arguments, cancel=None):
+    if cancel is not None:
+        cancel.set()
+    cancel = threading.Event()
+    for args in arguments:
+        PREFETCH_POOL.submit(_run_unless_cancelled, cancel, func, args)
+    return cancel
+
+# Slider values around value, nearest first, within [lo, hi]
+def neighbor_values(value, lo, hi, reach=2, step=1):
+    values = []
+    for distance in range(1, reach+1):
+        values += [v for v in (value + distance*step, value - distance*step) if lo <= v <= hi]
+    return values
+
+# The slider value one step further in the direction it moved from previous (up if it did not move), within [lo, hi]
+def next_value(value, previous, lo, hi, step=1):
+    following = value - step if previous is not None and previous > value else value + step
+    return [following] if lo <= following <= hi else []
+
 # paths = []
 # years = 1
 # investment_volatility = 2